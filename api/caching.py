@@ -0,0 +1,149 @@
+# caching.py
+"""
+Response cache for the read-only API endpoints.
+
+Rendered responses are stored in the ``API_CACHE_ALIAS`` cache under a key
+made of the endpoint name, the data generation, the full path (query string
+included) and the requested media type. scrape_necta bumps the generation
+when it finishes (see api.services.bump_data_generation), so every cached
+response goes stale exactly when new results land and nothing has to be
+deleted.
+
+The same generation gives strong ETags and Last-Modified headers (the time
+of the last scrape), so clients polling an endpoint get a 304 Not Modified
+until new results land.
+"""
+import functools
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .metrics import render_response
+from .services import data_generation
+
+# Response headers replayed on a cache hit
+CACHED_HEADERS = ("Content-Type", "Vary", "Allow")
+
+
+class CacheStats:
+    """
+    Thread-safe hit/miss counters per endpoint, for this process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = {}
+        self.misses = {}
+
+    def hit(self, name):
+        with self._lock:
+            self.hits[name] = self.hits.get(name, 0) + 1
+
+    def miss(self, name):
+        with self._lock:
+            self.misses[name] = self.misses.get(name, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+            self.misses.clear()
+
+    def summary(self):
+        with self._lock:
+            names = sorted(set(self.hits) | set(self.misses))
+            return {name: {"hits": self.hits.get(name, 0), "misses": self.misses.get(name, 0)} for name in names}
+
+
+stats = CacheStats()
+
+
+def response_cache():
+    return caches[settings.API_CACHE_ALIAS]
+
+
+def request_generation(request):
+    """
+    The data generation, looked up once per request.
+    """
+    if not hasattr(request, "_data_generation"):
+        request._data_generation = data_generation()
+    return request._data_generation
+
+
+def representation(request, generation):
+    """
+    Identify the response to ``request`` at ``generation``: same path,
+    query string, media type and data give the same bytes.
+    """
+    number, updated_at = generation
+    # The timestamp keeps keys unique even if the counter is ever reset
+    stamp = updated_at.timestamp() if updated_at else 0
+    digest = hashlib.sha1(
+        f"{request.get_full_path()}|{request.META.get('HTTP_ACCEPT', '')}".encode("utf-8")
+    ).hexdigest()
+    return f"{number}:{stamp}:{digest}"
+
+
+def cache_key(name, request, generation):
+    return f"api:{name}:{representation(request, generation)}"
+
+
+def etag(request, *args, **kwargs):
+    generation = request_generation(request)
+    if generation[1] is None:
+        return None
+    return '"%s"' % hashlib.sha1(representation(request, generation).encode("utf-8")).hexdigest()
+
+
+def last_modified(request, *args, **kwargs):
+    return request_generation(request)[1]
+
+
+def conditional_response(view):
+    """
+    Add ETag and Last-Modified headers to a view's responses and answer
+    matching If-None-Match / If-Modified-Since requests with a 304. Clients
+    are told to revalidate every time, which costs them an empty response
+    until the data changes.
+    """
+    view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+    return cache_control(no_cache=True)(view)
+
+
+def cached_response(name):
+    """
+    Cache the successful GET responses of a DRF view under ``name``. Goes on
+    top of ``@api_view``. Responses carry an ``X-Cache: HIT`` or ``MISS``
+    header.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET":
+                return view(request, *args, **kwargs)
+
+            cache = response_cache()
+            key = cache_key(name, request, request_generation(request))
+            cached = cache.get(key)
+            if cached is not None:
+                stats.hit(name)
+                headers, content = cached
+                response = HttpResponse(content, headers=headers)
+                response["X-Cache"] = "HIT"
+                return response
+
+            stats.miss(name)
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                render_response(request, response)
+                headers = {header: response[header] for header in CACHED_HEADERS if header in response}
+                cache.set(key, (headers, response.content), settings.API_CACHE_TIMEOUT)
+            response["X-Cache"] = "MISS"
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,92 @@
+# exports.py
+"""
+Bulk export of exam results as CSV or NDJSON.
+
+Rows are read with ``values_list().iterator()`` and written out one at a time,
+so memory use stays flat however many results are exported. Used by the
+``api/export/`` endpoint and the ``export_results`` command.
+"""
+import csv
+import json
+
+from django.db.models import F
+
+from .models import ExamResult
+
+# Export column -> ExamResult lookup
+EXPORT_COLUMNS = {
+    "exam": "exam",
+    "year": "year",
+    "rank": "ranking__national_rank",
+    "region_rank": "ranking__region_rank",
+    "code": "school__code",
+    "name": "school__name",
+    "region": "school__region",
+    "gpa": "gpa",
+    "division1": "division1",
+    "division2": "division2",
+    "division3": "division3",
+    "division4": "division4",
+    "division0": "division0",
+    "total": "total",
+}
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+CHUNK_SIZE = 2000
+
+
+def export_rows(exam=None, year=None, region=None):
+    """
+    Yield result rows as tuples in ``EXPORT_COLUMNS`` order, by exam, year
+    and rank. Results without a valid GPA come last in their year, unranked.
+    """
+    results = ExamResult.objects.all()
+    if exam:
+        results = results.filter(exam=exam.upper())
+    if year:
+        results = results.filter(year=year)
+    if region:
+        results = results.filter(school__region_key=region.lower())
+    results = results.order_by("exam", "year", F("ranking__national_rank").asc(nulls_last=True), "id")
+    return results.values_list(*EXPORT_COLUMNS.values()).iterator(chunk_size=CHUNK_SIZE)
+
+
+class Echo:
+    """
+    File-like object whose ``write`` hands back what it was given, so
+    ``csv.writer`` can produce lines one at a time.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(list(EXPORT_COLUMNS))
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    columns = list(EXPORT_COLUMNS)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row))) + "\n"
+
+
+def export_lines(rows, export_format="csv"):
+    """
+    Render ``rows`` as lines of text in ``export_format`` (one of ``FORMATS``).
+    """
+    if export_format == "ndjson":
+        return ndjson_lines(rows)
+    return csv_lines(rows)
+
+
+def export_filename(export_format, exam=None, year=None, region=None):
+    parts = ["results"] + [str(part).lower().replace(" ", "_") for part in (exam, year, region) if part]
+    return "_".join(parts) + "." + export_format
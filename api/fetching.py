@@ -0,0 +1,270 @@
+# fetching.py
+"""
+HTTP layer for the NECTA scraper: one pooled keep-alive session shared by all
+worker threads, with per-host concurrency limits, retries with exponential
+backoff and per-run statistics, plus an on-disk page cache for conditional
+re-fetches and local sources for recording and replaying a scrape offline.
+"""
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import unquote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import percentiles
+
+RETRY_STATUSES = {500, 502, 503, 504}
+
+
+class FetchStats:
+    """
+    Thread-safe counters for one scrape run.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.bytes = 0
+        self.latencies = []
+
+    def record(self, latency, size=0):
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+            self.latencies.append(latency)
+
+    def retried(self):
+        with self._lock:
+            self.retries += 1
+
+    def failed(self):
+        with self._lock:
+            self.failures += 1
+
+    def summary(self):
+        latency = percentiles(self.latencies)
+        return (
+            f"{self.requests} requests, {self.retries} retries, {self.failures} failures, "
+            f"{self.bytes / 1024 / 1024:.1f} MB, latency "
+            + " ".join(f"{name} {value * 1000:.0f}ms" for name, value in latency.items())
+        )
+
+
+class RateLimiter:
+    """
+    Space out requests to each host so no more than ``rate`` start per
+    second, whatever the number of threads.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next = {}
+
+    def wait(self, host):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class HttpClient:
+    """
+    Fetch pages through a single ``requests.Session`` so connections (and TLS
+    sessions) are reused across pages and threads.
+
+    At most ``per_host`` requests run against one host at a time and, with
+    ``rate``, at most ``rate`` requests start per second per host.
+
+    5xx responses, timeouts and connection errors are retried up to
+    ``retries`` times, sleeping ``backoff * 2 ** attempt`` seconds (plus a
+    little jitter) between attempts. Other HTTP errors are raised at once.
+    """
+
+    def __init__(self, per_host=8, retries=3, backoff=0.5, timeout=30, rate=None):
+        self.per_host = max(1, per_host)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.timeout = timeout
+        self.rate_limiter = RateLimiter(rate) if rate else None
+        self.stats = FetchStats()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.per_host)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._host_lock = threading.Lock()
+        self._host_slots = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+
+    def host_slot(self, url):
+        """
+        Return the semaphore limiting concurrent requests to the host of ``url``.
+        """
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            return self._host_slots[host]
+
+    def get(self, url, headers=None):
+        attempt = 0
+        while True:
+            if self.rate_limiter:
+                self.rate_limiter.wait(urlsplit(url).netloc)
+            started = time.monotonic()
+            try:
+                with self.host_slot(url):
+                    resp = self.session.get(url, headers=headers, timeout=self.timeout)
+                    content = resp.content
+                self.stats.record(time.monotonic() - started, len(content))
+                if resp.status_code not in RETRY_STATUSES:
+                    if resp.status_code >= 400:
+                        self.stats.failed()
+                    resp.raise_for_status()
+                    return resp
+                error = requests.HTTPError(f"{resp.status_code} Server Error for url: {url}", response=resp)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self.stats.record(time.monotonic() - started)
+                error = e
+
+            if attempt >= self.retries:
+                self.stats.failed()
+                raise error
+            self.stats.retried()
+            time.sleep(self.backoff * 2 ** attempt * random.uniform(1, 1.25))
+            attempt += 1
+
+    def close(self):
+        self.session.close()
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    """
+    On-disk cache of fetched pages keyed by URL. Each entry is a small JSON
+    file holding the ETag and Last-Modified validators, a hash of the page
+    content and the result parsed from it, so an unchanged page needs
+    neither its body stored nor to be parsed again.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url):
+        try:
+            with open(self.path(url), encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get("url") == url else None
+
+    def put(self, url, entry):
+        entry = dict(entry, url=url)
+        path = self.path(url)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+    @staticmethod
+    def conditional_headers(entry):
+        """
+        Request headers asking the server to answer 304 if the page is unchanged.
+        """
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+
+def local_path(directory, url):
+    """
+    Map ``url`` to a file under ``directory`` by its path, so
+    ``https://host/results/2023/csee/results/s0101.htm`` is stored as
+    ``directory/results/2023/csee/results/s0101.htm``.
+    """
+    parts = [part for part in unquote(urlsplit(url).path).split("/") if part not in ("", ".")]
+    if not parts or ".." in parts:
+        raise ValueError(f"Cannot map {url} to a local file")
+    return os.path.join(directory, *parts)
+
+
+class LocalResponse:
+    """
+    The part of ``requests.Response`` the scraper uses, for pages read from disk.
+    """
+
+    status_code = 200
+
+    def __init__(self, text):
+        self.text = text
+        self.headers = {}
+
+
+class LocalSource:
+    """
+    Stand-in for ``HttpClient`` that reads pages from a directory written by
+    ``RecordingClient`` (or ``api.samples.write_corpus``) instead of the network.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.stats = FetchStats()
+
+    def get(self, url, headers=None):
+        started = time.monotonic()
+        path = local_path(self.directory, url)
+        try:
+            with open(path, encoding="utf-8") as f:
+                text = f.read()
+        except FileNotFoundError:
+            self.stats.failed()
+            raise FileNotFoundError(f"{url} is not in {self.directory} (expected {path})")
+        self.stats.record(time.monotonic() - started, len(text))
+        return LocalResponse(text)
+
+    def close(self):
+        pass
+
+
+class RecordingClient:
+    """
+    Wrap a client and save every page it fetches under ``directory``, in the
+    layout ``LocalSource`` reads. Pages answered with 304 have no body and
+    are not saved again.
+    """
+
+    def __init__(self, client, directory):
+        self.client = client
+        self.directory = directory
+        self.stats = client.stats
+
+    def get(self, url, headers=None):
+        resp = self.client.get(url, headers=headers)
+        if resp.status_code == 200:
+            path = local_path(self.directory, url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(resp.text)
+        return resp
+
+    def close(self):
+        self.client.close()
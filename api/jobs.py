@@ -0,0 +1,95 @@
+# jobs.py
+"""
+Database-backed queue of scrape jobs.
+
+The API only queues jobs (``enqueue``); a separate ``scrape_worker`` process
+claims them one at a time and runs scrape_necta, which reports progress
+through ``JobProgress``. Because the queue lives in the database, every web
+worker sees the same jobs, and a job outlives the process that queued it.
+"""
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import ScrapeJob
+
+
+def enqueue(exam: str, year: int):
+    """
+    Queue a scrape of ``exam``/``year`` and return ``(job, created)``. If one
+    is already queued or running, that job is returned instead.
+    """
+    exam = exam.upper()
+    try:
+        with transaction.atomic():
+            return ScrapeJob.objects.create(exam=exam, year=year), True
+    except IntegrityError:
+        job = ScrapeJob.objects.filter(exam=exam, year=year, status__in=ScrapeJob.ACTIVE).first()
+        if job is None:
+            # It finished in the meantime
+            return enqueue(exam, year)
+        return job, False
+
+
+@transaction.atomic
+def claim_next(worker: str):
+    """
+    Mark the oldest queued job as running for ``worker`` and return it, or
+    None if the queue is empty. The conditional update makes sure two
+    workers never claim the same job.
+    """
+    job = ScrapeJob.objects.filter(status=ScrapeJob.QUEUED).order_by("created_at", "id").first()
+    if job is None:
+        return None
+    now = timezone.now()
+    claimed = ScrapeJob.objects.filter(pk=job.pk, status=ScrapeJob.QUEUED).update(
+        status=ScrapeJob.RUNNING, worker=worker, started_at=now, heartbeat_at=now,
+    )
+    if not claimed:
+        return None
+    job.refresh_from_db()
+    return job
+
+
+def finish(job, error=""):
+    ScrapeJob.objects.filter(pk=job.pk).update(
+        status=ScrapeJob.FAILED if error else ScrapeJob.DONE,
+        error=error,
+        finished_at=timezone.now(),
+    )
+
+
+def fail_stale(seconds: float) -> int:
+    """
+    Fail running jobs whose worker has not reported progress for ``seconds``,
+    so a crashed worker does not block its exam/year forever.
+    """
+    cutoff = timezone.now() - timedelta(seconds=seconds)
+    return ScrapeJob.objects.filter(status=ScrapeJob.RUNNING, heartbeat_at__lt=cutoff).update(
+        status=ScrapeJob.FAILED,
+        error="Worker stopped reporting progress",
+        finished_at=timezone.now(),
+    )
+
+
+class JobProgress:
+    """
+    Write a job's page counts at most once every ``interval`` seconds, so
+    progress reports cost a handful of queries per scrape.
+    """
+
+    def __init__(self, job_id, interval=1.0):
+        self.job_id = job_id
+        self.interval = interval
+        self.reported = 0.0
+
+    def update(self, done, failed, total, force=False):
+        now = time.monotonic()
+        if not force and now - self.reported < self.interval:
+            return
+        self.reported = now
+        ScrapeJob.objects.filter(pk=self.job_id).update(
+            pages_done=done, pages_failed=failed, pages_total=total, heartbeat_at=timezone.now(),
+        )
@@ -0,0 +1,600 @@
+import contextlib
+import glob
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import threading
+import time
+
+import django
+from bs4 import BeautifulSoup
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connection
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from api import legacy_parsing as legacy, samples, views
+from api.models import ExamResult, Ranking, School, SubjectPerformance
+from api.serializers import ExamResultSerializer, SchoolSerializer, flat_exam_results, flat_rankings
+from api.caching import response_cache
+from api.metrics import percentiles
+from api.services import ResultWriter, bump_data_generation, ranking_statistics, rebuild_rankings, refresh_summaries
+from api.management.commands.scrape_batch import parse_years
+from api.management.commands.scrape_necta import index_schools
+from api.parsing import PageExtractor, detect_region, parse_school_page, parse_school_result
+
+
+class Command(BaseCommand):
+    help = "Benchmark the scraper parsers and API endpoints on saved or synthetic data"
+
+    suites = ["parse", "region", "api", "rankings", "trends", "serialize", "locking"]
+
+    def add_arguments(self, parser):
+        parser.add_argument("--suite", action="append", choices=self.suites, help="Suite to run (repeatable, default: all)")
+        parser.add_argument("--pages", type=str, help="Directory of saved school pages (*.htm); synthetic pages are used when omitted")
+        parser.add_argument("--schools", type=int, default=50, help="Number of synthetic school pages (default: 50)")
+        parser.add_argument("--repeat", type=int, default=3, help="Passes over the pages per measurement (default: 3)")
+        parser.add_argument("--db-schools", type=int, default=5000, help="Schools per exam/year in the synthetic database (default: 5000)")
+        parser.add_argument("--requests", type=int, default=20, help="Requests per endpoint measurement (default: 20)")
+        parser.add_argument("--readers", type=int, default=4, help="Concurrent reader threads in the locking suite (default: 4)")
+        parser.add_argument("--years", type=str, default="2021-2023", help="Years of the api suite's synthetic database, e.g. 2014-2023 (default: 2021-2023)")
+        parser.add_argument("--exams", nargs="+", default=["csee", "acsee"], help="Exams of the api suite's synthetic database (default: csee acsee)")
+        parser.add_argument("--detail-schools", type=int, default=200, help="Schools of the latest year stored with subject and candidate rows in the api suite (default: 200)")
+        parser.add_argument("--report", type=str, help="Write every measurement to this JSON file")
+        parser.add_argument("--compare", type=str, help="JSON report of an earlier run to compare throughput with")
+
+    def load_pages(self, options):
+        if options["pages"]:
+            paths = sorted(glob.glob(os.path.join(options["pages"], "**", "*.htm"), recursive=True))
+            pages = []
+            for path in paths:
+                if os.path.basename(path).startswith("index"):
+                    continue
+                with open(path, encoding="utf-8", errors="replace") as f:
+                    pages.append(f.read())
+            if not pages:
+                raise CommandError(f"No school pages found under {options['pages']}")
+            return pages
+        return [
+            samples.render_school_page(school, "csee", 2023)
+            for school in samples.make_schools(options["schools"])
+        ]
+
+    def cpu_per_page(self, func, pages, repeat):
+        """
+        Return the CPU seconds spent per page by ``func``, best of ``repeat`` passes.
+        """
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            for html in pages:
+                func(html)
+            elapsed = (time.process_time() - started) / len(pages)
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    @contextlib.contextmanager
+    def scratch_database(self, options=None):
+        """
+        Run the block against a throwaway, migrated test database, so
+        synthetic data never touches the real one, with the test environment
+        set up so request factory requests are served for "testserver".
+
+        On SQLite the database is a temporary file rather than memory, so
+        connections opened by other threads see the same migrated schema.
+        ``options`` replaces the connection OPTIONS (and so the pragmas) of
+        every connection opened while it is in use.
+        """
+        name = connection.settings_dict["NAME"]
+        saved = connection.settings_dict["TEST"]["NAME"], connection.settings_dict["OPTIONS"]
+        # SQLite never closes in-memory connections (the test runner's
+        # database, for one), so set such a connection aside rather than
+        # letting it stand in for the scratch file
+        in_memory = None
+        if connection.vendor == "sqlite" and connection.is_in_memory_db() and connection.connection is not None:
+            in_memory, connection.connection = connection.connection, None
+        try:
+            setup_test_environment()
+            environment = True
+        except RuntimeError:
+            environment = False  # Already set up, by the test runner
+        with tempfile.TemporaryDirectory() as directory:
+            if connection.vendor == "sqlite":
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+            if options is not None:
+                connection.settings_dict["OPTIONS"] = options
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                yield
+            finally:
+                # create_test_db returns the scratch database's name, not the one it replaced
+                connection.creation.destroy_test_db(name, verbosity=0)
+                connection.settings_dict["TEST"]["NAME"], connection.settings_dict["OPTIONS"] = saved
+                if in_memory is not None:
+                    connection.connection = in_memory
+                if environment:
+                    teardown_test_environment()
+
+    def seed(self, schools, exam="csee", year=2023):
+        writer = ResultWriter(exam, year, batch_size=1000)
+        for school in samples.make_schools(schools, seed=year):
+            writer.add(samples.school_result(school))
+        writer.flush()
+        rebuild_rankings(exam, year)
+        refresh_summaries(exam, year)
+        bump_data_generation()
+
+    def record(self, name, **values):
+        """
+        Keep a measurement of the running suite for the JSON report.
+        """
+        self.results.setdefault(self.suite, {})[name] = values
+
+    def time_view(self, label, view, path, requests, cached=False, **kwargs):
+        """
+        Call a view ``requests`` times and report latency percentiles and
+        the number of SQL queries per request. The response cache is emptied
+        before each request unless ``cached`` is set. Streaming responses are
+        read to the end.
+        """
+        factory = APIRequestFactory()
+        latencies = []
+        for _ in range(requests):
+            if not cached:
+                response_cache().clear()
+            request = factory.get(path)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = view(request, **kwargs)
+                if hasattr(response, "render"):
+                    response.render()
+                if response.streaming:
+                    size = sum(len(chunk) for chunk in response.streaming_content)
+                else:
+                    size = len(response.content)
+                latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            self.stdout.write(self.style.WARNING(f"⚠️ {label}: status {response.status_code}"))
+        latency = percentiles(latencies, points=(50, 95))
+        self.stdout.write(
+            f"  {label}: p50 {latency['p50'] * 1000:.1f} ms, p95 {latency['p95'] * 1000:.1f} ms, "
+            f"{len(queries)} queries, {size / 1024:.0f} KB"
+        )
+        self.record(
+            label, ops_per_sec=round(len(latencies) / sum(latencies), 2),
+            p50_ms=round(latency["p50"] * 1000, 3), p95_ms=round(latency["p95"] * 1000, 3),
+            queries=len(queries), bytes=size,
+        )
+
+    def time_per_op(self, label, func, items, repeat, unit="page"):
+        """
+        Report and record the CPU time ``func`` spends per item of ``items``.
+        """
+        seconds = self.cpu_per_page(func, items, repeat)
+        self.stdout.write(f"  {label + ':':30} {seconds * 1000:.3f} ms per {unit}")
+        self.record_per_op(label, seconds)
+        return seconds
+
+    def record_per_op(self, label, seconds):
+        self.record(label, ops_per_sec=round(1 / seconds, 2) if seconds else None, ms_per_op=round(seconds * 1000, 4))
+
+    def handle(self, *args, **options):
+        self.results = {}
+        for suite in options["suite"] or self.suites:
+            self.suite = suite
+            getattr(self, f"bench_{suite}")(options)
+        if options["report"]:
+            self.write_report(options)
+        if options["compare"]:
+            self.compare(options["compare"])
+
+    def write_report(self, options):
+        try:
+            commit = subprocess.run(
+                ["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = None
+        report = {
+            "created": timezone.now().isoformat(),
+            "commit": commit,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "database": connection.vendor,
+            "options": {
+                key: options[key]
+                for key in ("schools", "repeat", "db_schools", "requests", "readers", "years", "exams", "detail_schools")
+            },
+            "results": self.results,
+        }
+        with open(options["report"], "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(f"✅ Report written to {options['report']}"))
+
+    def compare(self, path):
+        """
+        Print the throughput change of every measurement also in the report at ``path``.
+        """
+        with open(path, encoding="utf-8") as f:
+            baseline = json.load(f)
+        self.stdout.write(f"Compared with {path} ({baseline.get('commit') or 'unknown commit'}), ops/sec:")
+        for suite, results in self.results.items():
+            for name, values in results.items():
+                before = baseline["results"].get(suite, {}).get(name, {}).get("ops_per_sec")
+                after = values.get("ops_per_sec")
+                if before and after:
+                    self.stdout.write(f"  {suite}/{name}: {before:.1f} -> {after:.1f} ({100 * (after / before - 1):+.1f}%)")
+
+    def bench_parse(self, options):
+        pages = self.load_pages(options)
+
+        def parse_legacy(html):
+            soup = BeautifulSoup(html, "html.parser")
+            return {
+                "division_summary": legacy.parse_division_summary(soup),
+                "overall": legacy.parse_overall_performance(soup),
+                "division_performance": legacy.parse_division_performance(soup),
+                "subjects": legacy.parse_subjects_performance(soup),
+                "students": legacy.parse_student_results(soup),
+                "region": legacy.parse_school_region(soup, ""),
+            }
+
+        mismatches = 0
+        for html in pages:
+            before, after = parse_legacy(html), parse_school_page(html)
+            before.pop("region"), after.pop("region")
+            mismatches += before != after
+        if mismatches:
+            self.stdout.write(self.style.WARNING(f"⚠️ {mismatches} pages parse differently with the single-pass parser"))
+
+        before = self.cpu_per_page(parse_legacy, pages, options["repeat"])
+        after = self.cpu_per_page(parse_school_page, pages, options["repeat"])
+        self.stdout.write(f"Parsing {len(pages)} pages (CPU time per page, best of {options['repeat']}):")
+        self.stdout.write(f"  parse_* methods:   {before * 1000:.2f} ms")
+        self.stdout.write(f"  parse_school_page: {after * 1000:.2f} ms ({before / after:.2f}x)")
+        self.record_per_op("parse_* methods", before)
+        self.record_per_op("parse_school_page", after)
+
+        def extract(html):
+            extractor = PageExtractor()
+            extractor.feed(html)
+            return extractor.results()
+
+        self.stdout.write("Other parsers:")
+        self.time_per_op("PageExtractor", extract, pages, options["repeat"])
+        self.time_per_op("parse_school_result", lambda html: parse_school_result(html, "S0000", ""), pages, options["repeat"])
+        index = samples.render_index(samples.make_schools(max(options["schools"], 500)), "csee", 2023)
+        self.time_per_op(
+            "index_schools", lambda html: index_schools(html, "http://localhost"), [index], options["repeat"], unit="index page",
+        )
+
+    def bench_region(self, options):
+        pages = self.load_pages(options)
+        soups = [BeautifulSoup(html, "html.parser") for html in pages]
+        texts = []
+        for html in pages:
+            extractor = PageExtractor()
+            extractor.feed(html)
+            page_text, header, _ = extractor.results()
+            texts.append((page_text, header))
+
+        def run_legacy(index):
+            return legacy.parse_school_region(soups[index], "")
+
+        def run_matcher(index):
+            page_text, header = texts[index]
+            return detect_region(page_text, "", header)
+
+        def run_matcher_body(index):
+            return detect_region(texts[index][0], "")
+
+        # parse_school_region pulls the text out of the soup itself, while
+        # detect_region gets the text the single-pass extractor already
+        # collected, as it does inside parse_school_page.
+        indexes = range(len(pages))
+        before = self.cpu_per_page(run_legacy, indexes, options["repeat"])
+        after = self.cpu_per_page(run_matcher, indexes, options["repeat"])
+        body = self.cpu_per_page(run_matcher_body, indexes, options["repeat"])
+        self.stdout.write(f"Region detection on {len(pages)} pages (CPU time per page, best of {options['repeat']}):")
+        self.stdout.write(f"  parse_school_region:         {before * 1e6:.0f} µs")
+        self.stdout.write(f"  detect_region:               {after * 1e6:.0f} µs ({before / after:.2f}x)")
+        self.stdout.write(f"  detect_region, whole page:   {body * 1e6:.0f} µs ({before / body:.2f}x)")
+        self.record_per_op("parse_school_region", before)
+        self.record_per_op("detect_region", after)
+        self.record_per_op("detect_region, whole page", body)
+
+    def seed_details(self, schools, exam, year):
+        """
+        Store subject and candidate rows for ``schools`` of ``exam``/``year``
+        by parsing their rendered pages, as a scrape would.
+        """
+        writer = ResultWriter(exam, year, batch_size=500)
+        for school in schools:
+            html = samples.render_school_page(school, exam, year)
+            writer.add(parse_school_result(html, school["code"], school["name"]))
+        writer.flush()
+        rebuild_rankings(exam, year)
+        refresh_summaries(exam, year)
+        bump_data_generation()
+
+    def bench_api(self, options):
+        """
+        Every read endpoint over a multi-year synthetic database of
+        ``--db-schools`` schools per exam and year.
+        """
+        try:
+            years = parse_years(options["years"])
+        except ValueError:
+            raise CommandError(f"Invalid --years {options['years']}, expected e.g. 2014-2023 or 2019,2021")
+        exams = [exam.lower() for exam in options["exams"]]
+        exam, year = exams[0], years[-1]
+        requests = options["requests"]
+        with self.scratch_database():
+            started = time.perf_counter()
+            for seed_year in years:
+                for seed_exam in exams:
+                    self.seed(options["db_schools"], seed_exam, seed_year)
+            self.seed_details(samples.make_schools(options["detail_schools"], seed=year), exam, year)
+            self.stdout.write(
+                f"API endpoints, {options['db_schools']} schools x {len(years)} years x {len(exams)} exams "
+                f"({ExamResult.objects.count()} results, seeded in {time.perf_counter() - started:.1f}s):"
+            )
+
+            # A school with subject and candidate rows
+            school_id = ExamResult.objects.filter(exam=exam.upper(), year=year, students__isnull=False).values_list("school_id", flat=True).first()
+            region = School.objects.values_list("region", flat=True).first()
+            subject = SubjectPerformance.objects.filter(exam=exam.upper(), year=year).values_list("code", flat=True).first()
+            ids = ",".join(str(pk) for pk in School.objects.order_by("id").values_list("id", flat=True)[:500])
+            results = views.ExamResultViewSet.as_view({"get": "list"})
+            endpoints = [
+                ("home", views.home_data, "/api/home/", {}),
+                ("results", results, f"/api/results/?exam_type={exam}&year={year}", {}),
+                ("results, region", results, f"/api/results/?exam_type={exam}&year={year}&region={region}", {}),
+                ("rankings", views.rankings, f"/api/rankings/{exam}/{year}/", {"exam_type": exam, "year": year}),
+                ("rankings, first page", views.rankings, f"/api/rankings/{exam}/{year}/?page_size=50", {"exam_type": exam, "year": year}),
+                ("rankings summary", views.rankings_summary, f"/api/rankings/{exam}/{year}/summary/", {"exam_type": exam, "year": year}),
+                ("regions", views.region_summaries, f"/api/regions/{exam}/{year}/", {"exam_type": exam, "year": year}),
+                ("school detail", views.school_detail, f"/api/school/{school_id}/", {"school_id": school_id}),
+                ("school students", views.school_students, f"/api/school/{school_id}/students/?exam_type={exam}&year={year}", {"school_id": school_id}),
+                ("subjects", views.subjects_performance, f"/api/subjects/{exam}/{year}/", {"exam_type": exam, "year": year}),
+                (
+                    "subject leaderboard", views.subject_leaderboard, f"/api/subjects/{exam}/{year}/{subject}/",
+                    {"exam_type": exam, "year": year, "subject_code": subject},
+                ),
+                ("search", views.search_schools, "/api/search/?q=school%201", {}),
+                ("trends, 500 schools", views.school_trends, f"/api/trends/?exam={exam}&schools={ids}", {}),
+                ("export, csv", views.export_results, f"/api/export/?exam_type={exam}&year={year}", {}),
+                ("scrape status", views.scrape_status, "/api/scrape/status/", {}),
+            ]
+            for label, view, path, kwargs in endpoints:
+                self.time_view(label, view, path, requests, **kwargs)
+
+    def bench_rankings(self, options):
+        with self.scratch_database():
+            self.seed(options["db_schools"])
+            self.stdout.write(f"Rankings endpoint, {options['db_schools']} schools:")
+            self.time_view(
+                "rankings", views.rankings, "/api/rankings/csee/2023/", options["requests"],
+                exam_type="csee", year=2023,
+            )
+            self.time_view(
+                "rankings, columns", views.rankings, "/api/rankings/csee/2023/?layout=columns", options["requests"],
+                exam_type="csee", year=2023,
+            )
+            self.time_view(
+                "rankings, cached", views.rankings, "/api/rankings/csee/2023/", options["requests"],
+                cached=True, exam_type="csee", year=2023,
+            )
+            self.time_view(
+                "rankings, first page", views.rankings, "/api/rankings/csee/2023/?page_size=50",
+                options["requests"], exam_type="csee", year=2023,
+            )
+            self.time_view(
+                "rankings summary", views.rankings_summary, "/api/rankings/csee/2023/summary/",
+                options["requests"], exam_type="csee", year=2023,
+            )
+            self.time_view(
+                "regions", views.region_summaries, "/api/regions/csee/2023/",
+                options["requests"], exam_type="csee", year=2023,
+            )
+
+    def bench_trends(self, options):
+        years = range(2019, 2024)
+        with self.scratch_database():
+            for year in years:
+                self.seed(options["db_schools"], year=year)
+            ids = ",".join(str(pk) for pk in School.objects.order_by("id").values_list("id", flat=True)[:500])
+            region = School.objects.values_list("region", flat=True).first()
+            self.stdout.write(f"Trends endpoint, {options['db_schools']} schools x {len(years)} years:")
+            self.time_view("trends, 500 schools", views.school_trends, f"/api/trends/?exam=csee&schools={ids}", options["requests"])
+            self.time_view("trends, one region", views.school_trends, f"/api/trends/?exam=csee&region={region}", options["requests"])
+
+    def time_per_row(self, func, rows, repeat):
+        best = None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func(rows)
+            elapsed = (time.perf_counter() - started) / len(rows)
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def bench_serialize(self, options):
+        with self.scratch_database():
+            self.seed(options["db_schools"])
+            results = list(ExamResult.objects.select_related("school").order_by("gpa", "-total"))
+            result_rows = list(flat_exam_results.values(ExamResult.objects.order_by("gpa", "-total")))
+            rankings = list(Ranking.objects.select_related("result", "school").order_by("national_rank"))
+            ranking_rows = list(flat_rankings.values(Ranking.objects.order_by("national_rank")))
+
+        def serialize_rankings(rankings):
+            # The rankings view before the flat serializers
+            return [
+                {
+                    "rank": ranking.national_rank, "region_rank": ranking.region_rank,
+                    "percentile": ranking.percentile, "rank_change": ranking.rank_change,
+                    "school": SchoolSerializer(ranking.school).data,
+                    "gpa": ranking.result.gpa, "division1": ranking.result.division1,
+                    "division2": ranking.result.division2, "division3": ranking.result.division3,
+                    "division4": ranking.result.division4, "division0": ranking.result.division0,
+                    "total": ranking.result.total,
+                }
+                for ranking in rankings
+            ]
+
+        repeat = options["repeat"]
+        timings = [
+            ("ExamResultSerializer", self.time_per_row(lambda rows: ExamResultSerializer(rows, many=True).data, results, repeat)),
+            ("flat_exam_results", self.time_per_row(flat_exam_results.data, result_rows, repeat)),
+            ("flat_exam_results, columns", self.time_per_row(lambda rows: flat_exam_results.data(rows, "columns"), result_rows, repeat)),
+            ("SchoolSerializer per ranking", self.time_per_row(serialize_rankings, rankings, repeat)),
+            ("flat_rankings", self.time_per_row(flat_rankings.data, ranking_rows, repeat)),
+            ("flat_rankings, columns", self.time_per_row(lambda rows: flat_rankings.data(rows, "columns"), ranking_rows, repeat)),
+        ]
+        self.stdout.write(f"Serializing {len(results)} rows (time per row, best of {repeat}):")
+        for label, seconds in timings:
+            self.stdout.write(f"  {label + ':':30} {seconds * 1e6:.1f} µs")
+            self.record(label, ops_per_sec=round(1 / seconds, 2), us_per_row=round(seconds * 1e6, 3))
+
+    def bench_locking(self, options):
+        """
+        Readers load whole-year rankings while two scrape-like writers (one
+        per exam, as with two trigger_scrape calls) store three years of
+        results each, once with Django's default SQLite connection and once
+        with the OPTIONS from settings.
+        """
+        configured = connection.settings_dict["OPTIONS"]
+        if connection.vendor != "sqlite":
+            self.stdout.write("Locking suite skipped: the database is not SQLite")
+            return
+        self.stdout.write(
+            f"Reads during bulk writes, {options['readers']} readers, {options['db_schools']} schools per year:"
+        )
+        for label, connection_options in (("rollback journal (defaults)", {}), ("settings OPTIONS", configured)):
+            with self.scratch_database(options=connection_options):
+                self.seed(options["db_schools"])
+                journal_mode = self.thread_journal_mode()
+                report = self.run_load(options["readers"], options["db_schools"])
+            latency = report["latency"]
+            self.stdout.write(
+                f"  {label + ':':30} journal {journal_mode}, {report['reads']} reads, p50 {latency['p50'] * 1000:.1f} ms, "
+                f"p95 {latency['p95'] * 1000:.1f} ms, p99 {latency['p99'] * 1000:.1f} ms, "
+                f"{report['errors']} lock errors; writers {report['write_time']:.1f}s, "
+                f"{report['write_errors']} lock errors"
+            )
+            self.record(
+                label, ops_per_sec=round(report["reads"] / report["write_time"], 2) if report["write_time"] else None,
+                p50_ms=round(latency["p50"] * 1000, 3), p95_ms=round(latency["p95"] * 1000, 3),
+                read_errors=report["errors"], write_errors=report["write_errors"], write_seconds=round(report["write_time"], 2),
+                journal_mode=journal_mode,
+            )
+
+    def thread_journal_mode(self):
+        """
+        The journal mode of a connection opened by another thread, as the
+        load threads open theirs. Fails if that connection does not see the
+        migrated scratch database.
+        """
+        found = []
+
+        def check():
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    found.append(cursor.fetchone()[0])
+                found.append(Ranking.objects.exists())
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=check)
+        thread.start()
+        thread.join()
+        if len(found) != 2 or not found[1]:
+            raise CommandError("Load threads do not see the seeded scratch database")
+        return found[0]
+
+    def run_load(self, readers, schools, years=(2020, 2021, 2022)):
+        """
+        Only "database is locked" errors are counted; any other error stops
+        the load and is raised once the threads are done.
+        """
+        done = threading.Event()
+        lock = threading.Lock()
+        report = {"latencies": [], "errors": 0, "write_errors": 0, "write_time": 0.0}
+        failures = []
+
+        def locked(error):
+            return "database is locked" in str(error)
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as e:
+                with lock:
+                    failures.append(e)
+                done.set()
+
+        def read():
+            latencies, errors = [], 0
+            try:
+                while not done.is_set():
+                    started = time.perf_counter()
+                    try:
+                        # The whole-year rankings response, as the frontend loads it
+                        flat_rankings.data(flat_rankings.values(Ranking.objects.filter(exam="CSEE", year=2023)))
+                        ranking_statistics("csee", 2023)
+                    except OperationalError as e:
+                        if not locked(e):
+                            raise
+                        errors += 1
+                        continue
+                    latencies.append(time.perf_counter() - started)
+            finally:
+                close_old_connections()
+                connection.close()
+            with lock:
+                report["latencies"].extend(latencies)
+                report["errors"] += errors
+
+        def write(exam):
+            errors = 0
+            try:
+                for year in years:
+                    try:
+                        writer = ResultWriter(exam, year, batch_size=500)
+                        for school in samples.make_schools(schools, seed=year):
+                            writer.add(samples.school_result(school))
+                        writer.flush()
+                        rebuild_rankings(exam, year)
+                        refresh_summaries(exam, year)
+                    except OperationalError as e:
+                        if not locked(e):
+                            raise
+                        errors += 1
+            finally:
+                connection.close()
+                with lock:
+                    report["write_errors"] += errors
+
+        writers = [threading.Thread(target=run, args=(write, exam)) for exam in ("csee", "acsee")]
+        threads = [threading.Thread(target=run, args=(read,)) for _ in range(readers)]
+        started = time.perf_counter()
+        for thread in writers + threads:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        report["write_time"] = time.perf_counter() - started
+        done.set()
+        for thread in threads:
+            thread.join()
+        if failures:
+            raise failures[0]
+        return {
+            "reads": len(report["latencies"]),
+            "latency": percentiles(report["latencies"]),
+            "errors": report["errors"],
+            "write_errors": report["write_errors"],
+            "write_time": report["write_time"],
+        }
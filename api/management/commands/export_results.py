@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from api.exports import FORMATS, export_lines, export_rows
+
+
+class Command(BaseCommand):
+    help = "Export stored exam results as CSV or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exam", type=str, help="Exam type: CSEE or ACSEE (default: all)")
+        parser.add_argument("--year", type=int, help="Exam year (default: all)")
+        parser.add_argument("--region", type=str, help="Only schools in this region")
+        parser.add_argument("--format", choices=list(FORMATS), default="csv", help="Output format (default: csv)")
+        parser.add_argument("--output", type=str, help="File to write (default: standard output)")
+
+    def handle(self, *args, **options):
+        rows = export_rows(options["exam"], options["year"], options["region"])
+        lines = export_lines(rows, options["format"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1 if options["format"] == "csv" else 0  # The CSV header is not a result
+        with open(options["output"], "w", encoding="utf-8", newline="") as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"✅ Exported {count} results to {options['output']}"))
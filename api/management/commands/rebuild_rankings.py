@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.models import ExamResult
+from api.services import bump_data_generation, rebuild_rankings, refresh_summaries
+
+
+class Command(BaseCommand):
+    help = "Rebuild the materialized school rankings and result summaries from stored exam results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exam", type=str, help="Exam type: CSEE or ACSEE (default: all)")
+        parser.add_argument("--year", type=int, help="Exam year (default: all)")
+
+    def handle(self, *args, **options):
+        pairs = ExamResult.objects.values_list("exam", "year").distinct().order_by("exam", "year")
+        if options["exam"]:
+            pairs = pairs.filter(exam=options["exam"].upper())
+        if options["year"]:
+            pairs = pairs.filter(year=options["year"])
+
+        # Oldest first, so each year's rank changes use the rebuilt previous year
+        for exam, year in pairs:
+            count = rebuild_rankings(exam, year)
+            regions = refresh_summaries(exam, year)
+            self.stdout.write(f"Ranked {count} schools for {exam} {year}, summarized {regions} regions")
+        bump_data_generation()
+        self.stdout.write(self.style.SUCCESS("✅ Rankings and summaries rebuilt."))
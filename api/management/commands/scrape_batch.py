@@ -0,0 +1,148 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.fetching import PageCache
+from api.management.commands.scrape_necta import EXAMS, add_scrape_arguments, build_client, index_schools
+from api.pipeline import ScrapePipeline
+from api.services import ResultWriter, bump_data_generation, rebuild_rankings, refresh_summaries
+
+
+def parse_years(value):
+    """
+    Parse "2015-2024", "2019,2021" or a mix of both into a sorted list of years.
+    """
+    years = set()
+    for part in value.split(","):
+        first, _, last = part.strip().partition("-")
+        first, last = int(first), int(last or first)
+        if last < first:
+            raise CommandError(f"Invalid year range {part.strip()}, the first year must come first")
+        years.update(range(first, last + 1))
+    return sorted(years)
+
+
+def format_duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class Command(BaseCommand):
+    help = "Scrape several exams and years in one run, through a single shared fetch pool"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exams", nargs="+", default=EXAMS, help="Exam types (default: csee acsee)")
+        parser.add_argument("--years", type=str, required=True, help="Exam years, e.g. 2015-2024 or 2019,2021")
+        add_scrape_arguments(parser)
+        parser.add_argument("--progress", type=float, default=10, help="Seconds between progress reports (default: 10)")
+
+    def handle(self, *args, **options):
+        exams = [exam.lower() for exam in options["exams"]]
+        unknown = set(exams) - set(EXAMS)
+        if unknown:
+            raise CommandError(f"Only CSEE and ACSEE are supported, not {', '.join(sorted(unknown))}.")
+        try:
+            years = parse_years(options["years"])
+        except ValueError:
+            raise CommandError(f"Invalid --years {options['years']}, expected e.g. 2015-2024 or 2019,2021")
+        # Oldest year first, so each year's rank changes see the one before
+        runs = [(exam, year) for year in years for exam in exams]
+        workers = max(1, options["workers"])
+        self.client = build_client(options)
+
+        # Every index first, in parallel, so the page count (and the ETA) is
+        # known before the school pages start
+        with ThreadPoolExecutor(max_workers=min(workers, len(runs))) as pool:
+            indexes = list(pool.map(lambda run: self.load_index(run, options["base_url"]), runs))
+
+        scheduled = []
+        for (exam, year), schools in zip(runs, indexes):
+            if schools:
+                self.stdout.write(f"{exam.upper()} {year}: {len(schools)} schools")
+                scheduled.extend(dict(school, exam=exam, year=year) for school in schools)
+        if not scheduled:
+            raise CommandError("No school pages found for any exam/year.")
+        total = len(scheduled)
+        self.stdout.write(f"Scraping {total} school pages for {sum(1 for schools in indexes if schools)} exam/years...")
+
+        counts = {"fetched": 0, "unchanged": 0, "failed": 0}
+        self.changed = set()
+        cache = PageCache(options["cache_dir"]) if options["cache_dir"] else None
+        pipeline = ScrapePipeline(self.client, workers=workers, parse_workers=options["parse_workers"], cache=cache)
+        started = reported = time.monotonic()
+        current, writer = None, None
+        done = 0
+
+        # Pages of all exam/years share the pool but come back in schedule
+        # order, so each exam/year is committed and ranked as soon as its
+        # last page is in, while the next one's pages are already in flight.
+        for school, result, status in pipeline.run(scheduled):
+            run = (school["exam"], school["year"])
+            if run != current:
+                if writer:
+                    self.commit(current, writer)
+                current, writer = run, ResultWriter(*run, batch_size=options["batch_size"])
+
+            counts[status] += 1
+            done += 1
+            if "warning" in result:
+                self.stdout.write(self.style.WARNING(result["warning"]))
+            else:
+                writer.add(result)
+
+            now = time.monotonic()
+            if now - reported >= options["progress"]:
+                reported = now
+                rate = done / (now - started)
+                self.stdout.write(
+                    f"{done}/{total} pages ({100 * done / total:.0f}%), {rate:.1f} pages/sec, "
+                    f"ETA {format_duration((total - done) / rate)} ({current[0].upper()} {current[1]})"
+                )
+        self.commit(current, writer)
+        self.client.close()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Batch finished: {total} pages in {format_duration(elapsed)} "
+            f"({total / elapsed if elapsed else 0:.1f} pages/sec, {workers} fetch workers, {options['parse_workers']} parse workers)."
+        ))
+        self.stdout.write(f"HTTP: {self.client.stats.summary()}")
+        self.stdout.write(f"Pages: {counts['fetched']} fetched, {counts['unchanged']} unchanged, {counts['failed']} failed.")
+
+    def load_index(self, run, base_url):
+        exam, year = run
+        base_url = base_url.format(year=year, exam=exam)
+        index_url = f"{base_url}/index.htm"
+        try:
+            resp = self.client.get(index_url)
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"⚠️ Skipping {exam.upper()} {year}: failed to fetch {index_url}: {e}"))
+            return None
+        schools = index_schools(resp.text, base_url)
+        if schools is None:
+            self.stdout.write(self.style.WARNING(f"⚠️ Skipping {exam.upper()} {year}: no school result links on {index_url}"))
+        return schools
+
+    def commit(self, run, writer):
+        """
+        Write what is left of one exam/year, rank and summarize it and let the
+        API serve it.
+        """
+        writer.flush()
+        exam, year = run
+        # Rank changes are relative to the year before, so a re-ranked
+        # previous year re-ranks this one too
+        if not (writer.changed or (exam, year - 1) in self.changed):
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {exam.upper()} {year}: {writer.kept} results unchanged, rankings kept."
+            ))
+            return
+        self.changed.add(run)
+        ranked = rebuild_rankings(*run)
+        refresh_summaries(*run)
+        bump_data_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {exam.upper()} {year}: {writer.updated} results updated, {writer.kept} unchanged, {ranked} ranked."
+        ))
@@ -1,291 +1,184 @@
-import requests
 from bs4 import BeautifulSoup
 from django.core.management.base import BaseCommand, CommandError
-from api.models import School, ExamResult
-import re
+from api.jobs import JobProgress
+from api.fetching import HttpClient, LocalSource, PageCache, RecordingClient
+from api.services import ResultWriter, bump_data_generation, rebuild_rankings, refresh_summaries
+from api.pipeline import ScrapePipeline
+import time
 import os
 
 BASE_URL = "https://onlinesys.necta.go.tz/results/{year}/{exam}/"
-
-class Command(BaseCommand):
-    help = "Scrape NECTA results for CSEE or ACSEE and rank schools"
-
-    def add_arguments(self, parser):
-        parser.add_argument("--exam", type=str, required=True, help="Exam type: CSEE or ACSEE")
-        parser.add_argument("--year", type=int, required=True, help="Exam year (e.g. 2023)")
-
-    def parse_division_summary(self, soup):
-        div_counts = {"I": 0, "II": 0, "III": 0, "IV": 0, "0": 0}
-        division_table = None
-        tables = soup.find_all('table')
-        for table in tables:
-            if 'DIVISION PERFORMANCE SUMMARY' in table.get_text():
-                division_table = table
-                break
-        
-        if division_table:
-            rows = division_table.find_all('tr')
-            for row in rows:
-                cells = row.find_all(['td', 'th'])
-                if len(cells) >= 6 and cells[0].get_text(strip=True).upper() == 'T':
-                    try:
-                        div_counts["I"] = int(cells[1].get_text(strip=True) or 0)
-                        div_counts["II"] = int(cells[2].get_text(strip=True) or 0)
-                        div_counts["III"] = int(cells[3].get_text(strip=True) or 0)
-                        div_counts["IV"] = int(cells[4].get_text(strip=True) or 0)
-                        div_counts["0"] = int(cells[5].get_text(strip=True) or 0)
-                    except ValueError:
-                        pass
-                    break
+EXAMS = ["csee", "acsee"]
+
+
+def add_scrape_arguments(parser):
+    """
+    Fetching, parsing and writing options shared with scrape_batch.
+    """
+    parser.add_argument("--workers", type=int, default=1, help="Number of school pages fetched in parallel (default: 1)")
+    parser.add_argument("--parse-workers", type=int, default=0, help="Processes parsing pages in parallel; 0 parses on the fetch threads (default: 0)")
+    parser.add_argument("--per-host", type=int, default=8, help="Maximum concurrent requests to a single host (default: 8)")
+    parser.add_argument("--rate", type=float, help="Maximum requests started per second to a single host (default: no limit)")
+    parser.add_argument("--base-url", type=str, default=BASE_URL, help="Results URL template with {year} and {exam} placeholders")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per page on 5xx responses, timeouts and connection errors (default: 3)")
+    parser.add_argument("--backoff", type=float, default=0.5, help="Base delay in seconds between retries, doubled on each attempt (default: 0.5)")
+    parser.add_argument("--cache-dir", type=str, help="Directory of cached page validators and parsed results; re-runs only re-parse pages that changed")
+    parser.add_argument("--source", type=str, help="Read index and school pages from this directory instead of the network")
+    parser.add_argument("--record", type=str, help="Save every fetched page under this directory, for replay with --source")
+    parser.add_argument("--batch-size", type=int, default=500, help="Results written per transaction (default: 500)")
+    parser.add_argument("--timeout", type=float, default=30, help="Per-request timeout in seconds (default: 30)")
+
+
+def build_client(options):
+    """
+    The page source selected by the options: the live site through a pooled
+    HttpClient, or a --source directory, optionally recorded with --record.
+    """
+    if options["source"]:
+        if not os.path.isdir(options["source"]):
+            raise CommandError(f"--source {options['source']} is not a directory")
+        client = LocalSource(options["source"])
+    else:
+        client = HttpClient(
+            per_host=options["per_host"],
+            retries=options["retries"],
+            backoff=options["backoff"],
+            timeout=options["timeout"],
+            rate=options["rate"],
+        )
+    if options["record"]:
+        client = RecordingClient(client, options["record"])
+    return client
+
+
+def index_schools(html, base_url):
+    """
+    Return the schools linked from a results index page as dicts with
+    ``code``, ``name`` and ``url``, in index order. Returns None if the page
+    has no result links at all.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    
+    valid_links = []
+    for link in soup.find_all("a", href=True):
+        href = link["href"]
+        if (href.endswith('.htm') and 
+            not href.startswith('index_') and
+            not href == 'index.htm' and
+            not 'indexfiles' in href):
+            valid_links.append(link)
+    
+    if not valid_links:
+        return None
+
+    schools = []
+    for link in valid_links:
+        href = link["href"]
+        href = href.replace('\\', '/')
         
-        if not any(div_counts.values()):
-            text = soup.get_text()
-            patterns = [
-                r'[Tt]\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)',
-                r'Total\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)',
-            ]
-            for pattern in patterns:
-                matches = re.findall(pattern, text)
-                for match in matches:
-                    if len(match) == 5:
-                        try:
-                            div_counts["I"] = int(match[0])
-                            div_counts["II"] = int(match[1])
-                            div_counts["III"] = int(match[2])
-                            div_counts["IV"] = int(match[3])
-                            div_counts["0"] = int(match[4])
-                            break
-                        except ValueError:
-                            pass
+        if href.startswith(('http://', 'https://')):
+            school_url = href
+        else:
+            school_url = f"{base_url}{href}"
         
-        return div_counts
+        school_text = link.text.strip()
 
-    def parse_overall_performance(self, soup):
-        overall = {}
-        tables = soup.find_all('table')
-        for table in tables:
-            rows = table.find_all('tr')
-            for row in rows:
-                cells = row.find_all('td')
-                if len(cells) == 2:
-                    key = cells[0].get_text(strip=True).upper()
-                    value = cells[1].get_text(strip=True)
-                    overall[key] = value
-        return overall
+        parts = school_text.split(maxsplit=1)
+        if len(parts) < 2:
+            code = os.path.splitext(href)[0].upper()
+            name = school_text
+        else:
+            code, name = parts[0], parts[1]
 
-    def parse_division_performance(self, soup):
-        division_perf = {}
-        tables = soup.find_all('table')
-        for table in tables:
-            if 'EXAMINATION CENTRE DIVISION PERFORMANCE' in table.get_text():
-                rows = table.find_all('tr')
-                if len(rows) > 1:
-                    headers = [cell.get_text(strip=True) for cell in rows[0].find_all('td')]
-                    values = [cell.get_text(strip=True) for cell in rows[1].find_all('td')]
-                    for h, v in zip(headers, values):
-                        division_perf[h] = v
-                break
-        return division_perf
+        if 'index' in code.lower() or not code.startswith('S'):
+            continue
 
-    def parse_subjects_performance(self, soup):
-        subjects = []
-        tables = soup.find_all('table')
-        for table in tables:
-            if 'EXAMINATION CENTRE SUBJECTS PERFORMANCE' in table.get_text():
-                rows = table.find_all('tr')
-                if len(rows) > 1:
-                    headers = [cell.get_text(strip=True) for cell in rows[0].find_all('td')]
-                    for row in rows[1:]:
-                        values = [cell.get_text(strip=True) for cell in row.find_all('td')]
-                        subject = dict(zip(headers, values))
-                        subjects.append(subject)
-                break
-        return subjects
+        schools.append({"code": code, "name": name, "url": school_url})
+    return schools
 
-    def parse_student_results(self, soup):
-        students = []
-        tables = soup.find_all('table')
-        for table in tables:
-            if 'CNO' in table.get_text() and 'SEX' in table.get_text() and 'AGGT' in table.get_text() and 'DIV' in table.get_text() and 'DETAILED SUBJECTS' in table.get_text():
-                rows = table.find_all('tr')
-                for row in rows[1:]:  # Skip header
-                    cells = row.find_all('td')
-                    if len(cells) >= 5:
-                        cno = cells[0].get_text(strip=True)
-                        sex = cells[1].get_text(strip=True)
-                        aggt = cells[2].get_text(strip=True)
-                        div = cells[3].get_text(strip=True)
-                        subjects = cells[4].get_text(strip=True)
-                        students.append({
-                            'CNO': cno,
-                            'SEX': sex,
-                            'AGGT': aggt,
-                            'DIV': div,
-                            'DETAILED SUBJECTS': subjects
-                        })
-                break
-        return students
 
-    def parse_school_region(self, soup, school_name):
-        # Try to extract region from the page content
-        text = soup.get_text()
-        
-        # Common Tanzanian regions to look for
-        tanzania_regions = [
-            "Dar es Salaam", "Arusha", "Dodoma", "Mwanza", "Mbeya", "Tanga", "Morogoro",
-            "Kagera", "Mtwara", "Kilimanjaro", "Tabora", "Singida", "Rukwa", "Kigoma",
-            "Shinyanga", "Mara", "Manyara", "Ruvuma", "Lindi", "Pwani", "Geita", "Katavi",
-            "Njombe", "Simiyu", "Songwe", "Iringa", "Mjini Magharibi", "Unguja Kaskazini ", "Unguja Kusini", "Pemba Kaskazini", "Pemba Kusini"
-        ]
-        
-        # Look for region patterns in the text
-        region = "Unknown"
-        for reg in tanzania_regions:
-            if reg.lower() in text.lower():
-                region = reg
-                break
-        
-        # If region not found in text, try to infer from school name
-        if region == "Unknown":
-            for reg in tanzania_regions:
-                if reg.lower() in school_name.lower():
-                    region = reg
-                    break
-        
-        return region
+class Command(BaseCommand):
+    help = "Scrape NECTA results for CSEE or ACSEE and rank schools"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--exam", type=str, required=True, help="Exam type: CSEE or ACSEE")
+        parser.add_argument("--year", type=int, required=True, help="Exam year (e.g. 2023)")
+        add_scrape_arguments(parser)
+        parser.add_argument("--job", type=int, help="ScrapeJob id to report progress to (set by scrape_worker)")
 
     def handle(self, *args, **options):
         exam = options["exam"].lower()
         year = options["year"]
+        workers = max(1, options["workers"])
+        base_url = options["base_url"].format(year=year, exam=exam)
 
-        if exam not in ["csee", "acsee"]:
+        if exam not in EXAMS:
             raise CommandError("Only CSEE and ACSEE are supported.")
 
-        index_url = f"{BASE_URL.format(year=year, exam=exam)}/index.htm"
+        self.client = build_client(options)
+
+        index_url = f"{base_url}/index.htm"
         self.stdout.write(f"Fetching index: {index_url}")
 
         try:
-            resp = requests.get(index_url, timeout=30)
-            resp.raise_for_status()
+            resp = self.client.get(index_url)
         except Exception as e:
             raise CommandError(f"Failed to fetch {index_url}: {e}")
 
-        soup = BeautifulSoup(resp.text, "html.parser")
-        
-        valid_links = []
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            if (href.endswith('.htm') and 
-                not href.startswith('index_') and
-                not href == 'index.htm' and
-                not 'indexfiles' in href):
-                valid_links.append(link)
-        
-        if not valid_links:
+        schools = index_schools(resp.text, base_url)
+        if schools is None:
             with open("debug_page.html", "w", encoding="utf-8") as f:
                 f.write(resp.text)
             raise CommandError("No school result links found. The page structure may have changed. Saved page content to debug_page.html for inspection.")
 
-        self.stdout.write(f"Found {len(valid_links)} schools. Scraping results...")
+        self.stdout.write(f"Found {len(schools)} schools. Scraping results...")
 
         all_results = []
-
-        for link in valid_links:
-            href = link["href"]
-            href = href.replace('\\', '/')
-            
-            if href.startswith(('http://', 'https://')):
-                school_url = href
-            else:
-                school_url = f"{BASE_URL.format(year=year, exam=exam)}{href}"
-            
-            school_text = link.text.strip()
-
-            parts = school_text.split(maxsplit=1)
-            if len(parts) < 2:
-                code = os.path.splitext(href)[0].upper()
-                name = school_text
-            else:
-                code, name = parts[0], parts[1]
-
-            if 'index' in code.lower() or not code.startswith('S'):
-                continue
-
-            try:
-                sresp = requests.get(school_url, timeout=30)
-                sresp.raise_for_status()
-            except Exception as e:
-                self.stdout.write(self.style.WARNING(f"⚠️ Failed to fetch {school_url}: {e}"))
+        counts = {"fetched": 0, "unchanged": 0, "failed": 0}
+        started = time.monotonic()
+
+        writer = ResultWriter(exam, year, batch_size=options["batch_size"])
+        cache = PageCache(options["cache_dir"]) if options["cache_dir"] else None
+        progress = JobProgress(options["job"]) if options["job"] else None
+
+        # Pages are fetched and parsed by the pipeline and come back in index
+        # order; this thread is the only one writing, in batches.
+        pipeline = ScrapePipeline(self.client, workers=workers, parse_workers=options["parse_workers"], cache=cache)
+        for _, result, status in pipeline.run(schools):
+            counts[status] += 1
+            if progress:
+                progress.update(counts["fetched"] + counts["unchanged"], counts["failed"], len(schools))
+            if "warning" in result:
+                self.stdout.write(self.style.WARNING(result["warning"]))
                 continue
 
-            ssoup = BeautifulSoup(sresp.text, "html.parser")
-            
-            div_counts = self.parse_division_summary(ssoup)
-            overall = self.parse_overall_performance(ssoup)
-            division_perf = self.parse_division_performance(ssoup)
-            subjects = self.parse_subjects_performance(ssoup)
-            students = self.parse_student_results(ssoup)
-            
-            # Extract region information
-            region = self.parse_school_region(ssoup, name)
-            
-            gpa_str = overall.get('EXAMINATION CENTRE GPA', '')
-            gpa_match = re.search(r'([\d.]+)', gpa_str)
-            gpa = float(gpa_match.group(1)) if gpa_match else None
-            
-            if gpa is None:
-                self.stdout.write(self.style.WARNING(f"⚠️ GPA not found for {code} {name}, skipping."))
-                continue
-
-            total = int(division_perf.get('CLEAN', sum(div_counts.values()))) or 1
-
-            school, _ = School.objects.get_or_create(
-                code=code, 
-                defaults={
-                    "name": name,
-                    "region": region
-                }
-            )
-            
-            # Update region if it was previously unknown
-            if school.region == "Unknown" and region != "Unknown":
-                school.region = region
-                school.save()
-
-            ExamResult.objects.update_or_create(
-                school=school,
-                exam=exam.upper(),
-                year=year,
-                defaults={
-                    "division1": div_counts["I"],
-                    "division2": div_counts["II"],
-                    "division3": div_counts["III"],
-                    "division4": div_counts["IV"],
-                    "division0": div_counts["0"],
-                    "total": total,
-                    "gpa": gpa,
-                },
-            )
-
-            # Store result for ranking later
-            all_results.append({
-                "code": code,
-                "name": name,
-                "region": region,
-                "gpa": gpa,
-                "div1": div_counts["I"],
-                "div2": div_counts["II"],
-                "div3": div_counts["III"],
-                "div4": div_counts["IV"],
-                "div0": div_counts["0"],
-                "total": total
-            })
-
-            self.stdout.write(f" → {code} {name} (Region: {region}, Div I: {div_counts['I']}, II: {div_counts['II']}, III: {div_counts['III']}, IV: {div_counts['IV']}, 0: {div_counts['0']}, Total: {total}, GPA: {gpa})")
-
-        self.stdout.write(self.style.SUCCESS("✅ Scraping finished."))
-
-        # Rank schools by GPA
+            # Store result for ranking later, without the per-candidate rows
+            all_results.append({key: value for key, value in result.items() if key not in ("subjects", "students")})
+
+            if writer.add(result):
+                self.stdout.write(f" → {result['code']} {result['name']} (Region: {result['region']}, Div I: {result['div1']}, II: {result['div2']}, III: {result['div3']}, IV: {result['div4']}, 0: {result['div0']}, Total: {result['total']}, GPA: {result['gpa']})")
+
+        writer.flush()
+        if progress:
+            progress.update(counts["fetched"] + counts["unchanged"], counts["failed"], len(schools), force=True)
+        if writer.changed:
+            ranked = rebuild_rankings(exam, year)
+            refresh_summaries(exam, year)
+            # New results are in: invalidate cached API responses
+            bump_data_generation()
+        self.client.close()
+        elapsed = time.monotonic() - started
+        rate = len(schools) / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"✅ Scraping finished: {len(schools)} pages in {elapsed:.1f}s ({rate:.1f} pages/sec, {workers} fetch workers, {options['parse_workers']} parse workers)."))
+        self.stdout.write(f"HTTP: {self.client.stats.summary()}")
+        self.stdout.write(
+            f"Pages: {counts['fetched']} fetched, {counts['unchanged']} unchanged, {counts['failed']} failed. "
+            f"Results: {writer.updated} updated, {writer.kept} unchanged. "
+            + (f"Rankings rebuilt for {ranked} schools." if writer.changed else "Rankings unchanged.")
+        )
+
+        # Rank schools by GPA. all_results is in index order whatever --workers
+        # is, and the sort is stable, so the ranking file is deterministic.
         all_results.sort(key=lambda x: x["gpa"])
         self.stdout.write("\nRanking schools by GPA (lower is better):")
         for rank, result in enumerate(all_results, start=1):
@@ -298,4 +191,4 @@ class Command(BaseCommand):
             for rank, result in enumerate(all_results, start=1):
                 f.write(f"{rank}. {result['code']} {result['name']} - {result['region']} - GPA: {result['gpa']}\n")
 
-        self.stdout.write(self.style.SUCCESS(f"✅ Results saved to school_results_{year}_{exam}.txt")) 
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"✅ Results saved to school_results_{year}_{exam}.txt"))
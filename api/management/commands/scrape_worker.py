@@ -0,0 +1,63 @@
+import os
+import socket
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs
+from api.management.commands.scrape_necta import BASE_URL
+
+
+class Command(BaseCommand):
+    help = "Run queued scrape jobs (see POST /api/scrape/) one at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty instead of polling")
+        parser.add_argument("--poll", type=float, default=5.0, help="Seconds between queue checks when idle (default: 5)")
+        parser.add_argument("--stale", type=float, default=900, help="Fail running jobs with no progress for this many seconds (default: 900)")
+        parser.add_argument("--workers", type=int, default=8, help="scrape_necta --workers (default: 8)")
+        parser.add_argument("--parse-workers", type=int, default=0, help="scrape_necta --parse-workers (default: 0)")
+        parser.add_argument("--base-url", type=str, default=BASE_URL, help="scrape_necta --base-url")
+        parser.add_argument("--cache-dir", type=str, help="scrape_necta --cache-dir")
+
+    def handle(self, *args, **options):
+        name = f"{socket.gethostname()}:{os.getpid()}"
+        self.stdout.write(f"Scrape worker {name} waiting for jobs")
+        while True:
+            close_old_connections()
+            stale = jobs.fail_stale(options["stale"])
+            if stale:
+                self.stdout.write(self.style.WARNING(f"⚠️ Failed {stale} stale jobs"))
+
+            job = jobs.claim_next(name)
+            if job is None:
+                if options["once"]:
+                    return
+                time.sleep(options["poll"])
+                continue
+            self.run(job, options)
+
+    def run(self, job, options):
+        self.stdout.write(f"Job {job.id}: scraping {job.exam} {job.year}")
+        try:
+            call_command(
+                "scrape_necta",
+                exam=job.exam,
+                year=job.year,
+                job=job.id,
+                workers=options["workers"],
+                parse_workers=options["parse_workers"],
+                base_url=options["base_url"],
+                cache_dir=options["cache_dir"],
+                stdout=self.stdout,
+            )
+        except BaseException as e:
+            jobs.finish(job, error=str(e) or type(e).__name__)
+            self.stdout.write(self.style.ERROR(f"❌ Job {job.id} failed: {e}"))
+            if not isinstance(e, Exception):
+                raise
+        else:
+            jobs.finish(job)
+            self.stdout.write(self.style.SUCCESS(f"✅ Job {job.id} done"))
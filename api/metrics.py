@@ -0,0 +1,94 @@
+# metrics.py
+"""
+Small helpers for summarising timings collected by the scraper and the API.
+"""
+import math
+import threading
+import time
+from collections import deque
+
+
+def percentile(values, point):
+    """
+    Nearest-rank percentile of ``values`` (``point`` between 0 and 100).
+    Returns 0 for an empty list.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(point / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """
+    Return ``{"p50": ..., "p95": ..., "p99": ...}`` for ``values``.
+    """
+    ordered = sorted(values)
+    return {f"p{point}": percentile(ordered, point) for point in points}
+
+
+class RouteMetrics:
+    """
+    Thread-safe per-route samples of request measurements (see
+    api.middleware.TimingMiddleware), keeping the most recent ``size`` of
+    each route so memory stays bounded in a long-running process.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self._lock = threading.Lock()
+        self.routes = {}
+        self.counts = {}
+
+    def record(self, route, **sample):
+        with self._lock:
+            if route not in self.routes:
+                self.routes[route] = deque(maxlen=self.size)
+                self.counts[route] = 0
+            self.routes[route].append(sample)
+            self.counts[route] += 1
+
+    def reset(self):
+        with self._lock:
+            self.routes.clear()
+            self.counts.clear()
+
+    def summary(self):
+        """
+        ``{route: {"requests": n, measurement: {"p50": ..., "p95": ..., "p99": ...}}}``
+        over the kept samples of each route.
+        """
+        with self._lock:
+            routes = {route: (self.counts[route], list(samples)) for route, samples in self.routes.items()}
+        summary = {}
+        for route, (count, samples) in sorted(routes.items()):
+            summary[route] = {"requests": count}
+            for name in samples[0]:
+                values = [sample[name] for sample in samples if sample[name] is not None]
+                summary[route][name] = percentiles(values)
+        return summary
+
+
+route_metrics = RouteMetrics()
+
+
+def add_timing(request, name, seconds):
+    """
+    Add ``seconds`` to the ``name`` timing of a request measured by the
+    timing middleware; does nothing when the middleware is off.
+    """
+    timings = getattr(request, "_timings", None)
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def render_response(request, response):
+    """
+    Render a template or DRF response, timing it as the request's
+    serialization time.
+    """
+    started = time.perf_counter()
+    response.render()
+    add_timing(request, "serialize", time.perf_counter() - started)
+    return response
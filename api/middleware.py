@@ -0,0 +1,88 @@
+# middleware.py
+"""
+Opt-in request instrumentation.
+
+With ``API_METRICS = True``, ``TimingMiddleware`` measures every request's
+total time, SQL query count and time, serialization (rendering) time and
+response size. It reports them to the client in a ``Server-Timing`` header
+and keeps per-route samples in ``api.metrics.route_metrics``, served by
+``api/metrics/``. When the setting is off the middleware removes itself at
+startup and costs nothing.
+"""
+import contextlib
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import add_timing, route_metrics
+
+
+class QueryTimer:
+    """
+    Database execute wrapper counting the queries of a request and the time
+    spent in them.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class TimingMiddleware:
+    """
+    Goes first in ``MIDDLEWARE``, so its timings cover the whole request.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "API_METRICS", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request._timings = {}
+        queries = QueryTimer()
+        started = time.perf_counter()
+        with contextlib.ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        serialize = request._timings.get("serialize")
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        route_metrics.record(
+            match.route if match else "unmatched",
+            total_ms=total * 1000,
+            queries=queries.count,
+            sql_ms=queries.seconds * 1000,
+            serialize_ms=serialize * 1000 if serialize is not None else None,
+            bytes=size,
+        )
+
+        timings = [
+            f"total;dur={total * 1000:.1f}",
+            f'db;dur={queries.seconds * 1000:.1f};desc="{queries.count} queries"',
+        ]
+        if serialize is not None:
+            timings.append(f"serialize;dur={serialize * 1000:.1f}")
+        response["Server-Timing"] = ", ".join(timings)
+        return response
+
+    def process_template_response(self, request, response):
+        # Called right before Django renders a DRF or template response
+        started = time.perf_counter()
+        response.add_post_render_callback(
+            lambda response: add_timing(request, "serialize", time.perf_counter() - started)
+        )
+        return response
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cno', models.CharField(max_length=20)),
+                ('sex', models.CharField(blank=True, max_length=1)),
+                ('aggregate', models.PositiveSmallIntegerField(null=True)),
+                ('division', models.CharField(blank=True, max_length=4)),
+                ('subjects', models.CharField(blank=True, max_length=255)),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='students', to='api.examresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['cno'], name='api_student_cno_bd033f_idx')],
+                'unique_together': {('result', 'cno')},
+            },
+        ),
+        migrations.CreateModel(
+            name='SubjectPerformance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exam', models.CharField(max_length=10)),
+                ('year', models.IntegerField()),
+                ('code', models.CharField(max_length=10)),
+                ('name', models.CharField(max_length=100)),
+                ('registered', models.IntegerField(default=0)),
+                ('sat', models.IntegerField(default=0)),
+                ('passed', models.IntegerField(default=0)),
+                ('gpa', models.FloatField(default=0.0)),
+                ('result', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subjects', to='api.examresult')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exam', 'year', 'code', 'gpa'], name='api_subject_exam_af915a_idx')],
+                'unique_together': {('result', 'code')},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_rankings(apps, schema_editor):
+    """
+    Materialize rankings for the results already in the database, oldest
+    year first so rank changes can be computed.
+    """
+    ExamResult = apps.get_model('api', 'ExamResult')
+    Ranking = apps.get_model('api', 'Ranking')
+    ranks = {}
+    pairs = ExamResult.objects.values_list('exam', 'year').distinct().order_by('exam', 'year')
+    for exam, year in pairs:
+        results = list(
+            ExamResult.objects.filter(exam=exam, year=year, gpa__gt=0)
+            .order_by('gpa', '-total', 'id')
+            .values_list('id', 'school_id', 'school__region')
+        )
+        previous = ranks.get((exam, year - 1), {})
+        region_counts = {}
+        rankings = []
+        for rank, (result_id, school_id, region) in enumerate(results, start=1):
+            region_counts[region] = region_counts.get(region, 0) + 1
+            rankings.append(Ranking(
+                result_id=result_id, school_id=school_id, exam=exam, year=year, region=region,
+                national_rank=rank, region_rank=region_counts[region],
+                percentile=round(100 * (len(results) - rank + 1) / len(results), 2),
+                rank_change=previous[school_id] - rank if school_id in previous else None,
+            ))
+        Ranking.objects.bulk_create(rankings, batch_size=500)
+        ranks[(exam, year)] = {ranking.school_id: ranking.national_rank for ranking in rankings}
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_subject_student_results'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Ranking',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exam', models.CharField(max_length=10)),
+                ('year', models.IntegerField()),
+                ('region', models.CharField(max_length=100)),
+                ('national_rank', models.IntegerField()),
+                ('region_rank', models.IntegerField()),
+                ('percentile', models.FloatField()),
+                ('rank_change', models.IntegerField(null=True)),
+                ('result', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ranking', to='api.examresult')),
+                ('school', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rankings', to='api.school')),
+            ],
+            options={
+                'ordering': ['exam', 'year', 'national_rank'],
+                'indexes': [models.Index(fields=['exam', 'year', 'national_rank'], name='api_ranking_exam_f3cb9d_idx'), models.Index(fields=['exam', 'year', 'region', 'region_rank'], name='api_ranking_exam_1daec6_idx')],
+            },
+        ),
+        migrations.RunPython(build_rankings, migrations.RunPython.noop),
+    ]
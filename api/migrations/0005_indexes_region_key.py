@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_data_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='school',
+            name='region_key',
+            field=models.GeneratedField(db_index=True, db_persist=True, expression=django.db.models.functions.text.Lower('region'), output_field=models.CharField(max_length=100)),
+        ),
+        migrations.AddIndex(
+            model_name='examresult',
+            index=models.Index(fields=['exam', 'year', 'gpa', '-total'], name='api_examres_exam_e23083_idx'),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 5.2.5 on 2026-10-17 02:33
+
+import statistics
+from bisect import bisect_right
+
+from django.db import migrations, models
+
+# Frozen copies of api.services.GPA_BINS and summarize() as they were when
+# this migration was written
+GPA_BINS = [1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5]
+
+
+def summarize(rows):
+    """
+    ResultSummary field values for ``(total, gpa, division1, ..., division0)``
+    rows of results with a valid GPA.
+    """
+    if not rows:
+        return {'schools': 0, 'gpa_histogram': [0] * len(GPA_BINS)}
+    totals, gpas, *divisions = zip(*rows)
+    candidates = sum(totals)
+    histogram = [0] * len(GPA_BINS)
+    for gpa in gpas:
+        if gpa >= GPA_BINS[0]:
+            histogram[bisect_right(GPA_BINS, gpa) - 1] += 1
+    return {
+        'schools': len(rows),
+        'candidates': candidates,
+        **{f'division{number}': sum(counts) for number, counts in zip((1, 2, 3, 4, 0), divisions)},
+        'mean_gpa': round(sum(gpas) / len(gpas), 4),
+        'weighted_gpa': round(sum(gpa * total for gpa, total in zip(gpas, totals)) / candidates, 4) if candidates else None,
+        'median_gpa': round(statistics.median(gpas), 4),
+        'best_gpa': min(gpas),
+        'gpa_histogram': histogram,
+    }
+
+
+def build_summaries(apps, schema_editor):
+    """
+    Summarize the results already in the database.
+    """
+    ExamResult = apps.get_model('api', 'ExamResult')
+    ResultSummary = apps.get_model('api', 'ResultSummary')
+    pairs = ExamResult.objects.values_list('exam', 'year').distinct().order_by('exam', 'year')
+    for exam, year in pairs:
+        regions = {}
+        results = ExamResult.objects.filter(exam=exam, year=year, gpa__gt=0).values_list(
+            'school__region', 'total', 'gpa', 'division1', 'division2', 'division3', 'division4', 'division0',
+        )
+        for region, *row in results:
+            regions.setdefault(region, []).append(row)
+        everything = [row for rows in regions.values() for row in rows]
+        ResultSummary.objects.bulk_create([
+            ResultSummary(exam=exam, year=year, region=region, **summarize(rows))
+            for region, rows in [('', everything), *sorted(regions.items())]
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_scrape_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResultSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('exam', models.CharField(max_length=10)),
+                ('year', models.IntegerField()),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('schools', models.IntegerField(default=0)),
+                ('candidates', models.IntegerField(default=0)),
+                ('division1', models.IntegerField(default=0)),
+                ('division2', models.IntegerField(default=0)),
+                ('division3', models.IntegerField(default=0)),
+                ('division4', models.IntegerField(default=0)),
+                ('division0', models.IntegerField(default=0)),
+                ('mean_gpa', models.FloatField(null=True)),
+                ('weighted_gpa', models.FloatField(null=True)),
+                ('median_gpa', models.FloatField(null=True)),
+                ('best_gpa', models.FloatField(null=True)),
+                ('gpa_histogram', models.JSONField(default=list)),
+            ],
+            options={
+                'ordering': ['exam', 'year', 'region'],
+                'unique_together': {('exam', 'year', 'region')},
+            },
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,18 @@
 # models.py
 from django.db import models
+from django.db.models.functions import Lower
 
 class School(models.Model):
     code = models.CharField(max_length=20, unique=True)
     name = models.CharField(max_length=255)
     region = models.CharField(max_length=100, default="Unknown")
+    # Lower-cased region kept by the database, for indexed case-insensitive filters
+    region_key = models.GeneratedField(
+        expression=Lower("region"),
+        output_field=models.CharField(max_length=100),
+        db_persist=True,
+        db_index=True,
+    )
 
     def __str__(self):
         return f"{self.code} - {self.name} ({self.region})"
@@ -27,6 +35,172 @@ class ExamResult(models.Model):
     class Meta:
         unique_together = ("school", "exam", "year")
         ordering = ["gpa", "-total"]  # Order by GPA (ascending) then by total students (descending)
+        indexes = [
+            # Lists, statistics and ranking rebuilds of one exam/year, in rank order
+            models.Index(fields=["exam", "year", "gpa", "-total"]),
+        ]
 
     def __str__(self):
-        return f"{self.school.name} ({self.exam} {self.year}) - GPA: {self.gpa:.2f}" 
\ No newline at end of file
+        return f"{self.school.name} ({self.exam} {self.year}) - GPA: {self.gpa:.2f}" 
+
+class SubjectPerformance(models.Model):
+    """
+    One subject's results at one examination centre. ``exam`` and ``year``
+    are copied from the result so subject leaderboards are a single indexed
+    range scan.
+    """
+    result = models.ForeignKey(ExamResult, on_delete=models.CASCADE, related_name="subjects")
+    exam = models.CharField(max_length=10)
+    year = models.IntegerField()
+    code = models.CharField(max_length=10)
+    name = models.CharField(max_length=100)
+
+    registered = models.IntegerField(default=0)
+    sat = models.IntegerField(default=0)
+    passed = models.IntegerField(default=0)
+    gpa = models.FloatField(default=0.0)  # Lower is better, like the centre GPA
+
+    class Meta:
+        unique_together = ("result", "code")
+        indexes = [models.Index(fields=["exam", "year", "code", "gpa"])]
+
+    def __str__(self):
+        return f"{self.code} {self.name} ({self.exam} {self.year}) - GPA: {self.gpa:.4f}"
+
+
+class StudentResult(models.Model):
+    """
+    One candidate's result. Subject grades are kept as NECTA prints them
+    (e.g. "CIV - 'B'  HIST - 'C'") to keep rows small.
+    """
+    result = models.ForeignKey(ExamResult, on_delete=models.CASCADE, related_name="students")
+    cno = models.CharField(max_length=20)
+    sex = models.CharField(max_length=1, blank=True)
+    aggregate = models.PositiveSmallIntegerField(null=True)
+    division = models.CharField(max_length=4, blank=True)
+    subjects = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        unique_together = ("result", "cno")
+        indexes = [models.Index(fields=["cno"])]
+
+    def __str__(self):
+        return f"{self.cno} - Division {self.division}"
+
+
+class Ranking(models.Model):
+    """
+    Materialized ranking of one result among its exam/year, rebuilt after
+    each scrape (see api.services.rebuild_rankings) so reads never sort.
+    Only results with a valid GPA are ranked.
+    """
+    result = models.OneToOneField(ExamResult, on_delete=models.CASCADE, related_name="ranking")
+    school = models.ForeignKey(School, on_delete=models.CASCADE, related_name="rankings")
+    exam = models.CharField(max_length=10)
+    year = models.IntegerField()
+    region = models.CharField(max_length=100)
+
+    national_rank = models.IntegerField()
+    region_rank = models.IntegerField()
+    percentile = models.FloatField()  # Share of ranked schools at or below this one, 100 for the top school
+    rank_change = models.IntegerField(null=True)  # Previous year's national rank minus this one; positive is better
+
+    class Meta:
+        ordering = ["exam", "year", "national_rank"]
+        indexes = [
+            models.Index(fields=["exam", "year", "national_rank"]),
+            models.Index(fields=["exam", "year", "region", "region_rank"]),
+        ]
+
+    def __str__(self):
+        return f"#{self.national_rank} {self.exam} {self.year} - {self.school_id}"
+
+
+class ResultSummary(models.Model):
+    """
+    Aggregates of the ranked results (GPA > 0) of one exam/year in one
+    region, or nationally when ``region`` is blank. Rebuilt with the
+    rankings after each scrape (see api.services.refresh_summaries).
+    """
+    exam = models.CharField(max_length=10)
+    year = models.IntegerField()
+    region = models.CharField(max_length=100, blank=True)  # "" for the national row
+
+    schools = models.IntegerField(default=0)
+    candidates = models.IntegerField(default=0)
+    division1 = models.IntegerField(default=0)
+    division2 = models.IntegerField(default=0)
+    division3 = models.IntegerField(default=0)
+    division4 = models.IntegerField(default=0)
+    division0 = models.IntegerField(default=0)
+
+    mean_gpa = models.FloatField(null=True)  # Average of the school GPAs
+    weighted_gpa = models.FloatField(null=True)  # School GPAs weighted by candidates
+    median_gpa = models.FloatField(null=True)
+    best_gpa = models.FloatField(null=True)
+    gpa_histogram = models.JSONField(default=list)  # Schools per bin of api.services.GPA_BINS
+
+    class Meta:
+        unique_together = ("exam", "year", "region")
+        ordering = ["exam", "year", "region"]
+
+    def __str__(self):
+        return f"{self.exam} {self.year} {self.region or 'national'} - {self.schools} schools"
+
+
+class DataGeneration(models.Model):
+    """
+    Single row counting how many times the stored results have changed.
+    scrape_necta bumps it when a scrape finishes, which invalidates every
+    cached API response (see api.caching).
+    """
+    generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"generation {self.generation} ({self.updated_at})"
+
+
+class ScrapeJob(models.Model):
+    """
+    A queued run of scrape_necta for one exam/year, picked up by the
+    scrape_worker command. At most one job per exam/year is queued or
+    running at a time.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+    ACTIVE = [QUEUED, RUNNING]
+
+    exam = models.CharField(max_length=10)
+    year = models.IntegerField()
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+
+    pages_total = models.IntegerField(default=0)
+    pages_done = models.IntegerField(default=0)
+    pages_failed = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    worker = models.CharField(max_length=100, blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True)
+    heartbeat_at = models.DateTimeField(null=True)  # Last progress report from the worker
+    finished_at = models.DateTimeField(null=True)
+
+    class Meta:
+        ordering = ["-created_at", "-id"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["exam", "year"],
+                condition=models.Q(status__in=["queued", "running"]),
+                name="one_active_scrape_job",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.exam} {self.year} ({self.status})"
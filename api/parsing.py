@@ -0,0 +1,400 @@
+# parsing.py
+"""
+Parsing of NECTA school result pages.
+
+``parse_school_page`` reads the page in a single streaming pass, then
+classifies each table once by its header text and turns it into the section
+it holds. It returns the same data as the ``parse_*`` methods on the
+``scrape_necta`` command, which build a BeautifulSoup tree and rescan every
+table of it once per section.
+"""
+import re
+from html.parser import HTMLParser
+
+TANZANIA_REGIONS = [
+    "Dar es Salaam", "Arusha", "Dodoma", "Mwanza", "Mbeya", "Tanga", "Morogoro",
+    "Kagera", "Mtwara", "Kilimanjaro", "Tabora", "Singida", "Rukwa", "Kigoma",
+    "Shinyanga", "Mara", "Manyara", "Ruvuma", "Lindi", "Pwani", "Geita", "Katavi",
+    "Njombe", "Simiyu", "Songwe", "Iringa", "Mjini Magharibi", "Unguja Kaskazini", "Unguja Kusini", "Pemba Kaskazini", "Pemba Kusini"
+]
+
+# Lower-cased region name -> name as stored on School.region
+REGION_NAMES = {region.lower(): region for region in TANZANIA_REGIONS}
+
+DIVISION_TOTAL_PATTERNS = [
+    re.compile(r'[Tt]\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)'),
+    re.compile(r'Total\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)'),
+]
+
+# Districts (and main towns) whose name differs from their region's, so a
+# page or school name that only mentions the district still gets a region.
+DISTRICT_REGIONS = {
+    "Arusha": ["Meru", "Karatu", "Monduli", "Ngorongoro", "Longido", "Usa River"],
+    "Dar es Salaam": ["Ilala", "Kinondoni", "Temeke", "Ubungo", "Kigamboni"],
+    "Dodoma": ["Bahi", "Chamwino", "Chemba", "Kondoa", "Kongwa", "Mpwapwa"],
+    "Geita": ["Bukombe", "Chato", "Mbogwe", "Nyang'hwale"],
+    "Iringa": ["Kilolo", "Mufindi", "Mafinga"],
+    "Kagera": ["Biharamulo", "Bukoba", "Karagwe", "Kyerwa", "Missenyi", "Muleba", "Ngara"],
+    "Katavi": ["Mlele", "Mpanda", "Nsimbo"],
+    "Kigoma": ["Buhigwe", "Kakonko", "Kasulu", "Kibondo", "Uvinza"],
+    "Kilimanjaro": ["Hai", "Moshi", "Mwanga", "Rombo", "Siha"],
+    "Lindi": ["Kilwa", "Liwale", "Nachingwea", "Ruangwa"],
+    "Manyara": ["Babati", "Hanang", "Kiteto", "Mbulu", "Simanjiro"],
+    "Mara": ["Bunda", "Butiama", "Musoma", "Rorya", "Serengeti", "Tarime"],
+    "Mbeya": ["Chunya", "Kyela", "Mbarali", "Rungwe", "Busokelo"],
+    "Morogoro": ["Gairo", "Kilombero", "Kilosa", "Malinyi", "Mvomero", "Ulanga", "Ifakara"],
+    "Mtwara": ["Masasi", "Nanyumbu", "Newala", "Tandahimba"],
+    "Mwanza": ["Ilemela", "Kwimba", "Magu", "Misungwi", "Nyamagana", "Sengerema", "Ukerewe"],
+    "Njombe": ["Ludewa", "Makambako", "Makete", "Wanging'ombe"],
+    "Pwani": ["Bagamoyo", "Chalinze", "Kibaha", "Kibiti", "Kisarawe", "Mafia", "Mkuranga", "Rufiji"],
+    "Rukwa": ["Kalambo", "Nkasi", "Sumbawanga"],
+    "Ruvuma": ["Mbinga", "Namtumbo", "Nyasa", "Songea", "Tunduru"],
+    "Shinyanga": ["Kahama", "Kishapu", "Ushetu", "Msalala"],
+    "Simiyu": ["Bariadi", "Busega", "Itilima", "Maswa", "Meatu"],
+    "Singida": ["Ikungi", "Iramba", "Manyoni", "Mkalama"],
+    "Songwe": ["Ileje", "Mbozi", "Momba", "Tunduma", "Vwawa"],
+    "Tabora": ["Igunga", "Kaliua", "Nzega", "Sikonge", "Urambo", "Uyui"],
+    "Tanga": ["Handeni", "Kilindi", "Korogwe", "Lushoto", "Mkinga", "Muheza", "Pangani", "Bumbuli"],
+}
+
+# Lower-cased region or district name -> region
+PLACE_REGIONS = {
+    district.lower(): region
+    for region, districts in DISTRICT_REGIONS.items()
+    for district in districts
+}
+PLACE_REGIONS.update(REGION_NAMES)
+
+# Place names are matched on whole lower-cased words, so "Mara" never
+# matches inside "Maramba". Multi-word names ("dar es salaam") are indexed
+# by their first word, longest first.
+WORD_PATTERN = re.compile(r"[a-z']+")
+PLACE_PHRASES = {}
+for _name in sorted(PLACE_REGIONS, key=len, reverse=True):
+    _words = tuple(_name.split())
+    PLACE_PHRASES.setdefault(_words[0], []).append((_words, PLACE_REGIONS[_name]))
+PLACE_FIRST_WORDS = frozenset(PLACE_PHRASES)
+
+STUDENT_COLUMNS = ['CNO', 'SEX', 'AGGT', 'DIV', 'DETAILED SUBJECTS']
+
+
+class PageExtractor(HTMLParser):
+    """
+    Collect the text of a page and of every table in it in one streaming pass,
+    without building a document tree.
+
+    ``tables`` holds ``(text, rows)`` per table in document order, where
+    ``text`` is what ``table.get_text()`` returns and ``rows`` lists each
+    ``<tr>`` as ``(tag name, stripped text)`` cells, as BeautifulSoup's
+    recursive ``find_all`` would (rows of nested tables also belong to the
+    outer table). Unclosed ``<tr>``/``<td>`` tags are closed implicitly.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.text = []
+        self.header_end = None  # len(self.text) when the first table opened
+        self.tables = []
+        self._open = []  # (kind, item) for open tables, rows and cells
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('script', 'style'):
+            self._skip += 1
+        elif tag == 'table':
+            if self.header_end is None:
+                self.header_end = len(self.text)
+            table = ([], [])
+            self.tables.append(table)
+            self._open.append(('table', table))
+        elif tag == 'tr':
+            self._close_until('table', keep=True)
+            row = []
+            for kind, item in self._open:
+                if kind == 'table':
+                    item[1].append(row)
+            self._open.append(('tr', row))
+        elif tag in ('td', 'th'):
+            self._close_until('tr', keep=True, only='td')
+            cell = [tag]
+            for kind, item in self._open:
+                if kind == 'tr':
+                    item.append(cell)
+            self._open.append(('td', cell))
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style'):
+            self._skip = max(0, self._skip - 1)
+        elif tag == 'table':
+            self._close_until('table')
+        elif tag == 'tr':
+            self._close_until('tr')
+        elif tag in ('td', 'th'):
+            self._close_until('td')
+
+    def _close_until(self, kind, keep=False, only=None):
+        """
+        Pop open elements of the innermost table up to the nearest ``kind``,
+        popping that one too unless ``keep``. With ``only``, stop at the first
+        element of another kind.
+        """
+        if not any(open_kind == kind for open_kind, _ in self._open):
+            return
+        while self._open:
+            open_kind = self._open[-1][0]
+            if open_kind == kind:
+                if not keep:
+                    self._open.pop()
+                return
+            if open_kind == 'table' or (only and open_kind != only):
+                return
+            self._open.pop()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        self.text.append(data)
+        stripped = data.strip()
+        for kind, item in self._open:
+            if kind == 'table':
+                item[0].append(data)
+            elif kind == 'td' and stripped:
+                item.append(stripped)
+
+    def results(self):
+        """
+        Return ``(page text, header text, [(table text, rows), ...])``, where
+        the header is the text before the first table.
+        """
+        tables = []
+        for text, rows in self.tables:
+            tables.append((
+                "".join(text),
+                [[(cell[0], "".join(cell[1:])) for cell in row] for row in rows],
+            ))
+        header = self.text if self.header_end is None else self.text[:self.header_end]
+        return "".join(self.text), "".join(header), tables
+
+
+def _td(row):
+    return [text for name, text in row if name == 'td']
+
+
+def _division_summary(rows):
+    div_counts = {"I": 0, "II": 0, "III": 0, "IV": 0, "0": 0}
+    for row in rows:
+        if len(row) >= 6 and row[0][1].upper() == 'T':
+            try:
+                div_counts["I"] = int(row[1][1] or 0)
+                div_counts["II"] = int(row[2][1] or 0)
+                div_counts["III"] = int(row[3][1] or 0)
+                div_counts["IV"] = int(row[4][1] or 0)
+                div_counts["0"] = int(row[5][1] or 0)
+            except ValueError:
+                pass
+            break
+    return div_counts
+
+
+def _division_summary_from_text(text):
+    div_counts = {"I": 0, "II": 0, "III": 0, "IV": 0, "0": 0}
+    for pattern in DIVISION_TOTAL_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            for key, value in zip(div_counts, match.groups()):
+                div_counts[key] = int(value)
+    return div_counts
+
+
+def find_regions(text):
+    """
+    Yield the region of every region or district name in ``text``, in order.
+    """
+    words = WORD_PATTERN.findall(text.lower())
+    # Most text names no place at all; a set intersection rules that out
+    # without a Python-level loop over the words.
+    if PLACE_FIRST_WORDS.isdisjoint(words):
+        return
+    skip_to = 0
+    for index, word in enumerate(words):
+        if index < skip_to or word not in PLACE_FIRST_WORDS:
+            continue
+        for phrase, region in PLACE_PHRASES[word]:
+            if len(phrase) == 1 or tuple(words[index:index + len(phrase)]) == phrase:
+                skip_to = index + len(phrase)
+                yield region
+                break
+
+
+def detect_region(text, school_name, header=""):
+    """
+    Return the region a school page belongs to, matching region and district
+    names as whole words in one pass over each text:
+
+    1. the first place named in the page header (the text before the first
+       table, where the centre's details are),
+    2. else the region named most often (directly or through one of its
+       districts) in the rest of the page, earliest first on ties,
+    3. else the first place in the school name,
+
+    and "Unknown" when nothing matches.
+    """
+    for region in find_regions(header):
+        return region
+
+    counts = {}
+    for region in find_regions(text):
+        counts[region] = counts.get(region, 0) + 1
+    if counts:
+        # dicts keep insertion order, so max() keeps the earliest on ties
+        return max(counts, key=counts.get)
+
+    for region in find_regions(school_name):
+        return region
+    return "Unknown"
+
+
+def parse_school_page(html, school_name=""):
+    """
+    Parse a school results page into a dict with the keys ``division_summary``,
+    ``overall``, ``division_performance``, ``subjects``, ``students`` and
+    ``region``.
+    """
+    extractor = PageExtractor()
+    extractor.feed(html)
+    extractor.close()
+    page_text, header, tables = extractor.results()
+
+    division_summary = None
+    overall = {}
+    division_perf = None
+    subjects = None
+    students = None
+
+    for text, rows in tables:
+        for row in rows:
+            cells = _td(row)
+            if len(cells) == 2:
+                overall[cells[0].upper()] = cells[1]
+
+        if division_summary is None and 'DIVISION PERFORMANCE SUMMARY' in text:
+            division_summary = _division_summary(rows)
+
+        if division_perf is None and 'EXAMINATION CENTRE DIVISION PERFORMANCE' in text:
+            division_perf = {}
+            if len(rows) > 1:
+                division_perf = dict(zip(_td(rows[0]), _td(rows[1])))
+
+        if subjects is None and 'EXAMINATION CENTRE SUBJECTS PERFORMANCE' in text:
+            subjects = []
+            if len(rows) > 1:
+                headers = _td(rows[0])
+                subjects = [dict(zip(headers, _td(row))) for row in rows[1:]]
+
+        if students is None and all(marker in text for marker in STUDENT_COLUMNS):
+            students = []
+            for row in rows[1:]:
+                cells = _td(row)
+                if len(cells) >= 5:
+                    students.append(dict(zip(STUDENT_COLUMNS, cells[:5])))
+
+    if division_summary is None or not any(division_summary.values()):
+        division_summary = _division_summary_from_text(page_text)
+
+    return {
+        "division_summary": division_summary,
+        "overall": overall,
+        "division_performance": division_perf or {},
+        "subjects": subjects or [],
+        "students": students or [],
+        "region": detect_region(page_text, school_name, header),
+    }
+
+
+def _number(value, cast=int):
+    match = re.search(r'\d+(?:\.\d+)?', value or '')
+    return cast(match.group(0)) if match else None
+
+
+def compact_subjects(subjects):
+    """
+    Turn subject rows keyed by table header into
+    ``[code, name, registered, sat, passed, gpa]`` lists.
+    """
+    rows = []
+    seen = set()
+    for subject in subjects:
+        code = subject.get('CODE') or subject.get('SUBJECT CODE')
+        if not code or code in seen:
+            continue
+        seen.add(code)
+        rows.append([
+            code,
+            subject.get('SUBJECT NAME', ''),
+            _number(subject.get('REG')) or 0,
+            _number(subject.get('SAT')) or 0,
+            _number(subject.get('PASS')) or 0,
+            _number(subject.get('GPA'), float) or 0.0,
+        ])
+    return rows
+
+
+def compact_students(students):
+    """
+    Turn candidate rows into ``[cno, sex, aggregate, division, subjects]``
+    lists, keeping the first row of a repeated candidate number.
+    """
+    rows = []
+    seen = set()
+    for student in students:
+        cno = student['CNO']
+        if not cno or cno in seen:
+            continue
+        seen.add(cno)
+        rows.append([
+            cno,
+            student['SEX'][:1],
+            _number(student['AGGT']),
+            student['DIV'][:4],
+            student['DETAILED SUBJECTS'][:255],
+        ])
+    return rows
+
+
+def parse_school_result(html, code, name):
+    """
+    Parse a school page down to what is stored for the school: region, GPA,
+    division counts and number of clean candidates, plus compact per-subject
+    and per-candidate rows. Returns ``{"warning": ...}`` when the page has no
+    centre GPA.
+
+    Only plain data goes in and out, so this can run in a worker process.
+    """
+    page = parse_school_page(html, name)
+    div_counts = page["division_summary"]
+    overall = page["overall"]
+    division_perf = page["division_performance"]
+
+    gpa_str = overall.get('EXAMINATION CENTRE GPA', '')
+    gpa_match = re.search(r'([\d.]+)', gpa_str)
+    gpa = float(gpa_match.group(1)) if gpa_match else None
+
+    if gpa is None:
+        return {"warning": f"⚠️ GPA not found for {code} {name}, skipping."}
+
+    total = int(division_perf.get('CLEAN', sum(div_counts.values()))) or 1
+
+    return {
+        "code": code,
+        "name": name,
+        "region": page["region"],
+        "gpa": gpa,
+        "div1": div_counts["I"],
+        "div2": div_counts["II"],
+        "div3": div_counts["III"],
+        "div4": div_counts["IV"],
+        "div0": div_counts["0"],
+        "total": total,
+        "subjects": compact_subjects(page["subjects"]),
+        "students": compact_students(page["students"]),
+    }
@@ -0,0 +1,157 @@
+# pipeline.py
+"""
+Fetch → parse → write pipeline used by ``scrape_necta``.
+
+School pages are fetched on a thread pool. Each fetched page is handed
+straight to a process pool for parsing, so the fetch thread is free for the
+next request while CPU-bound parsing runs on other cores. Results are
+yielded back in input order to a single consumer, which does all the DB
+writes.
+"""
+import multiprocessing
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+from .fetching import PageCache, content_hash
+from .parsing import parse_school_result
+
+
+class FetchError(Exception):
+    pass
+
+
+class ScrapePipeline:
+    """
+    ``workers`` threads fetch pages through ``client``; ``parse_workers``
+    processes parse them (0 parses on the fetch threads instead). At most
+    ``window`` pages are in flight, so memory stays bounded on large indexes.
+
+    With a ``PageCache``, pages are fetched with conditional requests and a
+    page that is unchanged (304, or the same content hash) reuses the result
+    stored in the cache instead of being parsed again.
+    """
+
+    def __init__(self, client, workers=1, parse_workers=0, cache=None, window=None):
+        self.client = client
+        self.workers = max(1, workers)
+        self.parse_workers = max(0, parse_workers)
+        self.cache = cache
+        self.window = window or 4 * max(self.workers, self.parse_workers)
+
+    def fetch(self, school):
+        """
+        Fetch a school page. Returns a dict with the page ``text`` and its
+        validators, or with ``unchanged`` and the cached ``entry`` when the
+        cache shows the page has not changed.
+        """
+        url = school["url"]
+        entry = self.cache.get(url) if self.cache else None
+        try:
+            resp = self.client.get(url, headers=PageCache.conditional_headers(entry))
+        except Exception as e:
+            raise FetchError(f"⚠️ Failed to fetch {url}: {e}") from e
+
+        if entry is not None and resp.status_code == 304:
+            return {"unchanged": True, "entry": entry}
+
+        page = {
+            "text": resp.text,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "hash": content_hash(resp.text) if self.cache else None,
+            "unchanged": False,
+        }
+        if entry is not None and entry.get("hash") == page["hash"]:
+            page.update(unchanged=True, entry=entry)
+        return page
+
+    def fetch_and_parse(self, school):
+        try:
+            page = self.fetch(school)
+        except FetchError as e:
+            return {"warning": str(e)}, None
+        if page["unchanged"]:
+            return page["entry"]["result"], page
+        return parse_school_result(page.pop("text"), school["code"], school["name"]), page
+
+    def submit(self, fetch_pool, parse_pool, school):
+        """
+        Start fetching ``school`` and return a future for ``(result, page)``.
+        """
+        if parse_pool is None:
+            return fetch_pool.submit(self.fetch_and_parse, school)
+
+        outcome = Future()
+
+        def fetched(future):
+            try:
+                page = future.result()
+            except FetchError as e:
+                outcome.set_result(({"warning": str(e)}, None))
+                return
+            except Exception as e:
+                outcome.set_exception(e)
+                return
+            if page["unchanged"]:
+                outcome.set_result((page["entry"]["result"], page))
+                return
+
+            def parsed(future):
+                try:
+                    outcome.set_result((future.result(), page))
+                except Exception as e:
+                    outcome.set_exception(e)
+
+            try:
+                parse_pool.submit(parse_school_result, page.pop("text"), school["code"], school["name"]).add_done_callback(parsed)
+            except Exception as e:
+                outcome.set_exception(e)
+
+        fetch_pool.submit(self.fetch, school).add_done_callback(fetched)
+        return outcome
+
+    def finish(self, school, future):
+        """
+        Wait for a school's outcome, store freshly parsed pages in the cache and
+        return ``(school, result, status)``.
+        """
+        result, page = future.result()
+        if page is None:
+            return school, result, "failed"
+        if page["unchanged"]:
+            return school, result, "unchanged"
+        if self.cache:
+            self.cache.put(school["url"], {
+                "etag": page["etag"],
+                "last_modified": page["last_modified"],
+                "hash": page["hash"],
+                "result": result,
+            })
+        return school, result, "fetched"
+
+    def run(self, schools):
+        """
+        Yield ``(school, result, status)`` for every school in order, where
+        result is the dict from ``parse_school_result`` or ``{"warning": ...}``
+        and status is "fetched", "unchanged" or "failed".
+        """
+        parse_pool = None
+        if self.parse_workers:
+            # Spawned rather than forked: the parent already runs fetch threads
+            # and Django, and the workers only need api.parsing.
+            parse_pool = ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        pending = deque()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers) as fetch_pool:
+                for school in schools:
+                    pending.append((school, self.submit(fetch_pool, parse_pool, school)))
+                    if len(pending) >= self.window:
+                        yield self.finish(*pending.popleft())
+                while pending:
+                    yield self.finish(*pending.popleft())
+        finally:
+            if parse_pool is not None:
+                parse_pool.shutdown(cancel_futures=True)
@@ -0,0 +1,206 @@
+# samples.py
+"""
+Synthetic NECTA pages shaped like the ones served by onlinesys.necta.go.tz.
+
+Used by the tests and for local scraper runs so that nothing has to hit the
+real results site.
+"""
+import contextlib
+import functools
+import os
+import random
+import threading
+import time
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+REGIONS = [
+    "Dar es Salaam", "Arusha", "Dodoma", "Mwanza", "Mbeya", "Tanga", "Morogoro",
+    "Kagera", "Mtwara", "Kilimanjaro", "Tabora", "Singida", "Rukwa", "Kigoma",
+    "Shinyanga", "Mara", "Manyara", "Ruvuma", "Lindi", "Pwani", "Geita", "Katavi",
+    "Njombe", "Simiyu", "Songwe", "Iringa",
+]
+
+SUBJECTS = [
+    ("011", "CIVICS"), ("012", "HISTORY"), ("013", "GEOGRAPHY"), ("021", "KISWAHILI"),
+    ("022", "ENGLISH LANGUAGE"), ("031", "PHYSICS"), ("032", "CHEMISTRY"),
+    ("033", "BIOLOGY"), ("041", "BASIC MATHEMATICS"),
+]
+
+GRADES = ["A", "B", "C", "D", "F"]
+DIVISIONS = ["I", "II", "III", "IV", "0"]
+
+
+def school_code(number):
+    return f"S{number:04d}"
+
+
+def make_schools(count, seed=0):
+    """
+    Return ``count`` fake schools as dicts with code, name, region, gpa and
+    candidate counts. The same seed always produces the same schools.
+    """
+    rng = random.Random(seed)
+    schools = []
+    for number in range(1, count + 1):
+        divisions = [rng.randint(0, 40) for _ in DIVISIONS]
+        if not any(divisions):
+            divisions[0] = 1
+        schools.append({
+            "code": school_code(number),
+            "name": f"SCHOOL {number} SECONDARY SCHOOL",
+            "region": rng.choice(REGIONS),
+            "gpa": round(rng.uniform(1.0, 5.0), 4),
+            "divisions": divisions,
+        })
+    return schools
+
+
+def school_result(school):
+    """
+    The result ``api.parsing.parse_school_result`` would return for a school's
+    page, without the subject and candidate rows.
+    """
+    div1, div2, div3, div4, div0 = school["divisions"]
+    return {
+        "code": school["code"], "name": school["name"], "region": school["region"], "gpa": school["gpa"],
+        "div1": div1, "div2": div2, "div3": div3, "div4": div4, "div0": div0,
+        "total": sum(school["divisions"]),
+    }
+
+
+def render_index(schools, exam, year):
+    links = [
+        '<a href="index_a.htm">A - M</a>',
+        '<a href="index_n.htm">N - Z</a>',
+    ]
+    for school in schools:
+        links.append(
+            f'<a href="results/{school["code"].lower()}.htm">{school["code"]} {school["name"]}</a>'
+        )
+    # Private candidate centres are listed on the index but never ranked
+    links.append('<a href="results/p0101.htm">P0101 PRIVATE CANDIDATES</a>')
+    body = "<br>\n".join(links)
+    return f"<html><head><title>{exam.upper()} {year} RESULTS</title></head><body>\n{body}\n</body></html>\n"
+
+
+def render_school_page(school, exam, year, students=None):
+    rng = random.Random(school["code"])
+    div1, div2, div3, div4, div0 = school["divisions"]
+    clean = sum(school["divisions"])
+    if students is None:
+        students = clean
+
+    rows = []
+    rows.append(f'<h3>{school["code"]} {school["name"]}</h3>')
+    rows.append(f'<p>{school["region"].upper()}</p>')
+
+    rows.append('<table><caption>EXAMINATION CENTRE DIVISION PERFORMANCE</caption>')
+    headers = ["REGIST", "ABSENT", "SAT", "WITHHELD", "NO-CA", "CLEAN",
+               "DIV I", "DIV II", "DIV III", "DIV IV", "DIV 0"]
+    values = [clean, 0, clean, 0, 0, clean, div1, div2, div3, div4, div0]
+    rows.append("<tr>" + "".join(f"<td>{h}</td>" for h in headers) + "</tr>")
+    rows.append("<tr>" + "".join(f"<td>{v}</td>" for v in values) + "</tr>")
+    rows.append("</table>")
+
+    rows.append("<table>")
+    rows.append(f'<tr><td>EXAMINATION CENTRE GPA</td><td>{school["gpa"]:.4f}</td></tr>')
+    rows.append("</table>")
+
+    rows.append("<table><caption>DIVISION PERFORMANCE SUMMARY</caption>")
+    rows.append("<tr><td>SEX</td><td>I</td><td>II</td><td>III</td><td>IV</td><td>0</td></tr>")
+    female = [count // 2 for count in school["divisions"]]
+    male = [count - f for count, f in zip(school["divisions"], female)]
+    for sex, counts in (("F", female), ("M", male), ("T", school["divisions"])):
+        rows.append(f"<tr><td>{sex}</td>" + "".join(f"<td>{c}</td>" for c in counts) + "</tr>")
+    rows.append("</table>")
+
+    rows.append("<table><caption>EXAMINATION CENTRE SUBJECTS PERFORMANCE</caption>")
+    headers = ["CODE", "SUBJECT NAME", "REG", "SAT", "NO-CA", "W/HD", "CLEAN", "PASS", "GPA", "COMPETENCY LEVEL"]
+    rows.append("<tr>" + "".join(f"<td>{h}</td>" for h in headers) + "</tr>")
+    for code, name in SUBJECTS:
+        passed = rng.randint(0, clean)
+        values = [code, name, clean, clean, 0, 0, clean, passed, f"{rng.uniform(1.0, 5.0):.4f}", "SATISFACTORY"]
+        rows.append("<tr>" + "".join(f"<td>{v}</td>" for v in values) + "</tr>")
+    rows.append("</table>")
+
+    rows.append("<table>")
+    rows.append("<tr><td>CNO</td><td>SEX</td><td>AGGT</td><td>DIV</td><td>DETAILED SUBJECTS</td></tr>")
+    for number in range(1, students + 1):
+        grades = "  ".join(f"{name.split()[0][:4]} - '{rng.choice(GRADES)}'" for _, name in SUBJECTS[:7])
+        rows.append(
+            f'<tr><td>{school["code"]}/{number:04d}</td><td>{rng.choice("FM")}</td>'
+            f'<td>{rng.randint(7, 35)}</td><td>{rng.choice(DIVISIONS)}</td><td>{grades}</td></tr>'
+        )
+    rows.append("</table>")
+
+    body = "\n".join(rows)
+    return f"<html><head><title>{school['code']} {exam.upper()} {year}</title></head><body>\n{body}\n</body></html>\n"
+
+
+def write_corpus(directory, exam, year, schools):
+    """
+    Write an index page and one page per school under
+    ``directory/results/{year}/{exam}/``, mirroring the layout of the live site.
+    Returns the directory the pages were written to.
+    """
+    exam = exam.lower()
+    root = os.path.join(directory, "results", str(year), exam)
+    os.makedirs(os.path.join(root, "results"), exist_ok=True)
+    with open(os.path.join(root, "index.htm"), "w", encoding="utf-8") as f:
+        f.write(render_index(schools, exam, year))
+    for school in schools:
+        path = os.path.join(root, "results", f"{school['code'].lower()}.htm")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(render_school_page(school, exam, year, students=min(sum(school["divisions"]), 60)))
+    return root
+
+
+class SlowHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler that sleeps before answering, like a far-away server,
+    and answers the first ``failures`` requests for each path with a 503.
+    """
+
+    latency = 0.0
+    failures = 0
+    attempts = None
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failures:
+            with self.lock:
+                self.attempts[self.path] = self.attempts.get(self.path, 0) + 1
+                failing = self.attempts[self.path] <= self.failures
+            if failing:
+                self.send_error(503)
+                return
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextlib.contextmanager
+def serve_corpus(directory, latency=0.0, failures=0):
+    """
+    Serve ``directory`` over HTTP on a free local port for the duration of the
+    block, adding ``latency`` seconds to every response and failing the first
+    ``failures`` requests per path. Yields the results URL template to pass as
+    ``scrape_necta --base-url``.
+    """
+    handler = type("Handler", (SlowHandler,), {
+        "latency": latency,
+        "failures": failures,
+        "attempts": {},
+        "lock": threading.Lock(),
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        host, port = server.server_address
+        yield f"http://{host}:{port}/results/{{year}}/{{exam}}/"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,107 @@
+# search.py
+"""
+School search for type-ahead lookups.
+
+On SQLite, school codes and names are indexed in an FTS5 table
+(``api_school_search``) that mirrors ``api_school`` through triggers, with
+prefix indexes so every keystroke is an index lookup. The table and
+triggers are (re)installed after each ``migrate`` by ``install_index``:
+Django rebuilds SQLite tables for many schema changes, which drops their
+triggers. Other databases fall back to plain LIKE queries.
+"""
+import re
+
+from django.db import connection, connections
+from django.db.models import Q
+
+from .models import ExamResult, School
+
+INDEX_TABLE = "api_school_search"
+
+INDEX_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {INDEX_TABLE} USING fts5(
+        code, name, content='api_school', content_rowid='id', prefix='1 2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_insert AFTER INSERT ON api_school BEGIN
+        INSERT INTO {INDEX_TABLE}(rowid, code, name) VALUES (new.id, new.code, new.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_delete AFTER DELETE ON api_school BEGIN
+        INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rowid, code, name) VALUES ('delete', old.id, old.code, old.name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_update AFTER UPDATE OF code, name ON api_school BEGIN
+        INSERT INTO {INDEX_TABLE}({INDEX_TABLE}, rowid, code, name) VALUES ('delete', old.id, old.code, old.name);
+        INSERT INTO {INDEX_TABLE}(rowid, code, name) VALUES (new.id, new.code, new.name);
+    END""",
+    f"INSERT INTO {INDEX_TABLE}({INDEX_TABLE}) VALUES ('rebuild')",
+]
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def uses_index(db=connection):
+    return db.vendor == "sqlite"
+
+
+def install_index(db=connection):
+    """
+    Create the search table and its triggers if missing and rebuild the
+    index from ``api_school``.
+    """
+    if not uses_index(db) or School._meta.db_table not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in INDEX_SQL:
+            cursor.execute(statement)
+
+
+def install_index_after_migrate(sender, using, **kwargs):
+    install_index(connections[using])
+
+
+def match_expression(query):
+    """
+    FTS5 query matching every word of ``query`` as a prefix, or "" if it has
+    no words. Words are quoted so FTS5 operators are taken literally.
+    """
+    return " ".join(f'"{token}"*' for token in TOKEN_PATTERN.findall(query.lower()))
+
+
+def school_ids(query, limit=10):
+    """
+    Ids of the schools best matching ``query``, best first.
+    """
+    if not uses_index():
+        query = query.strip()
+        return list(
+            School.objects.filter(Q(code__istartswith=query) | Q(name__icontains=query))
+            .order_by("name").values_list("id", flat=True)[:limit]
+        )
+    expression = match_expression(query)
+    if not expression:
+        return []
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {INDEX_TABLE} WHERE {INDEX_TABLE} MATCH %s ORDER BY rank LIMIT %s",
+            [expression, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_schools(query, limit=10):
+    """
+    Up to ``limit`` schools matching ``query`` as dicts, each with its
+    latest result (exam, year, GPA and national rank) or None.
+    """
+    ids = school_ids(query, limit)
+    if not ids:
+        return []
+    schools = {school["id"]: school for school in School.objects.filter(id__in=ids).values("id", "code", "name", "region")}
+    latest = {}
+    results = (
+        ExamResult.objects.filter(school_id__in=ids)
+        .order_by("-year", "exam")
+        .values_list("school_id", "exam", "year", "gpa", "ranking__national_rank")
+    )
+    for school_id, exam, year, gpa, rank in results:
+        latest.setdefault(school_id, {"exam": exam, "year": year, "gpa": gpa, "rank": rank})
+    return [dict(schools[school_id], latest=latest.get(school_id)) for school_id in ids if school_id in schools]
@@ -1,14 +1,131 @@
 from rest_framework import serializers
-from .models import School, ExamResult
+from .models import School, ExamResult, ScrapeJob, StudentResult, SubjectPerformance
 
 class SchoolSerializer(serializers.ModelSerializer):
     class Meta:
         model = School
-        fields = '__all__'
+        fields = ('id', 'code', 'name', 'region')
 
 class ExamResultSerializer(serializers.ModelSerializer):
     school = SchoolSerializer(read_only=True)
     
     class Meta:
         model = ExamResult
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+class SubjectPerformanceSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubjectPerformance
+        fields = ('code', 'name', 'registered', 'sat', 'passed', 'gpa')
+
+class StudentResultSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = StudentResult
+        fields = ('cno', 'sex', 'aggregate', 'division', 'subjects')
+
+
+class ScrapeJobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+    rate = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ScrapeJob
+        fields = (
+            'id', 'exam', 'year', 'status', 'pages_total', 'pages_done', 'pages_failed',
+            'progress', 'rate', 'error', 'created_at', 'started_at', 'heartbeat_at', 'finished_at',
+        )
+
+    def get_progress(self, job):
+        """Percentage of pages processed"""
+        if not job.pages_total:
+            return 0
+        return round(100 * (job.pages_done + job.pages_failed) / job.pages_total, 1)
+
+    def get_rate(self, job):
+        """Pages per second since the job started"""
+        end = job.finished_at or job.heartbeat_at
+        if not job.started_at or not end or end <= job.started_at:
+            return 0
+        return round(job.pages_done / (end - job.started_at).total_seconds(), 1)
+
+class FlatSerializer:
+    """
+    Fast path for large lists: turns ``values()`` rows straight into dicts
+    with a fixed schema, skipping the per-object field introspection of
+    ModelSerializer. ``fields`` is a list of (output name, lookup) pairs;
+    dotted names such as ``school.code`` are nested one level deep.
+    """
+
+    def __init__(self, fields):
+        self.names = [name for name, _ in fields]
+        self.lookups = [lookup for _, lookup in fields]
+        # Output slots in order: (name, lookup) or (name, [(key, lookup), ...])
+        self.slots = []
+        groups = {}
+        for name, lookup in fields:
+            group, _, key = name.partition('.')
+            if not key:
+                self.slots.append((name, lookup))
+            elif group in groups:
+                groups[group].append((key, lookup))
+            else:
+                groups[group] = [(key, lookup)]
+                self.slots.append((group, groups[group]))
+
+    def values(self, queryset):
+        return queryset.values(*self.lookups)
+
+    def row(self, values):
+        return {
+            name: values[lookup] if isinstance(lookup, str) else {key: values[inner] for key, inner in lookup}
+            for name, lookup in self.slots
+        }
+
+    def data(self, rows, layout=None):
+        """
+        Serialize ``values()`` rows as a list of dicts, or with
+        ``layout='columns'`` as ``{"fields": [...], "rows": [[...], ...]}``,
+        which repeats no keys.
+        """
+        if layout == 'columns':
+            return {'fields': self.names, 'rows': [[values[lookup] for lookup in self.lookups] for values in rows]}
+        return [self.row(values) for values in rows]
+
+
+SCHOOL_FIELDS = [
+    ('school.id', 'school_id'),
+    ('school.code', 'school__code'),
+    ('school.name', 'school__name'),
+    ('school.region', 'school__region'),
+]
+
+# Same shape as ExamResultSerializer
+flat_exam_results = FlatSerializer([
+    ('id', 'id'),
+    *SCHOOL_FIELDS,
+    ('exam', 'exam'),
+    ('year', 'year'),
+    ('division1', 'division1'),
+    ('division2', 'division2'),
+    ('division3', 'division3'),
+    ('division4', 'division4'),
+    ('division0', 'division0'),
+    ('total', 'total'),
+    ('gpa', 'gpa'),
+])
+
+# Rows of the rankings endpoint, read from Ranking
+flat_rankings = FlatSerializer([
+    ('rank', 'national_rank'),
+    ('region_rank', 'region_rank'),
+    ('percentile', 'percentile'),
+    ('rank_change', 'rank_change'),
+    *SCHOOL_FIELDS,
+    ('gpa', 'result__gpa'),
+    ('division1', 'result__division1'),
+    ('division2', 'result__division2'),
+    ('division3', 'result__division3'),
+    ('division4', 'result__division4'),
+    ('division0', 'result__division0'),
+    ('total', 'result__total'),
+])
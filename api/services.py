@@ -1,12 +1,379 @@
 # services.py
-from .models import ExamResult
+import statistics
+from bisect import bisect_right
+
+from django.db import connection, transaction
+from django.db.models import Avg, Count, F, Min, Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import DataGeneration, School, ExamResult, Ranking, ResultSummary, StudentResult, SubjectPerformance
+
+# ExamResult field -> key in a scraped result (see api.parsing.parse_school_result)
+RESULT_FIELDS = {
+    "division1": "div1",
+    "division2": "div2",
+    "division3": "div3",
+    "division4": "div4",
+    "division0": "div0",
+    "total": "total",
+    "gpa": "gpa",
+}
+
+
+# Lower edges of the GPA histogram bins of ResultSummary; the last bin is open-ended
+GPA_BINS = [1.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 4.5]
+
 
 def get_ranked_schools(exam_type: str, year: int):
     """
-    Get schools ranked by GPA (lower is better) for a specific exam type and year
+    Get schools ranked by GPA (lower is better) for a specific exam type and year,
+    read in rank order from the materialized rankings
     """
     return ExamResult.objects.filter(
-        exam=exam_type.upper(), 
-        year=year,
-        gpa__gt=0  # Exclude schools with invalid GPA
-    ).select_related('school').order_by("gpa", "-total") 
\ No newline at end of file
+        ranking__exam=exam_type.upper(),
+        ranking__year=year,
+    ).select_related('school', 'ranking').order_by("ranking__national_rank")
+
+
+def ranking_statistics(exam_type: str, year: int, region: str = None):
+    """
+    Summary statistics of the ranked results (GPA > 0) of one exam/year,
+    optionally limited to one region. Read from the precomputed summaries
+    when they exist, otherwise computed in a single aggregate query
+    """
+    summary = ResultSummary.objects.filter(exam=exam_type.upper(), year=year, region__iexact=region or "").first()
+    if summary is not None:
+        def schools_between(low, high=None):
+            return sum(
+                count for edge, count in zip(GPA_BINS, summary.gpa_histogram)
+                if edge >= low and (high is None or edge < high)
+            )
+
+        return {
+            'total_schools': summary.schools,
+            'total_students': summary.candidates,
+            'avg_gpa_all': round(summary.mean_gpa or 0, 2),
+            'best_gpa': round(summary.best_gpa, 4) if summary.best_gpa else 0,
+            'division_totals': {
+                'div1': summary.division1,
+                'div2': summary.division2,
+                'div3': summary.division3,
+                'div4': summary.division4,
+                'div0': summary.division0,
+            },
+            'gpa_ranges': {
+                '1_2': schools_between(1.0, 2.0),
+                '2_3': schools_between(2.0, 3.0),
+                '3_4': schools_between(3.0, 4.0),
+                '4_plus': schools_between(4.0),
+            },
+        }
+
+    results = ExamResult.objects.filter(exam=exam_type.upper(), year=year, gpa__gt=0)
+    if region:
+        results = results.filter(school__region_key=region.lower())
+
+    stats = results.aggregate(
+        total_schools=Count('id'),
+        total_students=Coalesce(Sum('total'), 0),
+        avg_gpa_all=Avg('gpa'),
+        best_gpa=Min('gpa'),
+        div1=Coalesce(Sum('division1'), 0),
+        div2=Coalesce(Sum('division2'), 0),
+        div3=Coalesce(Sum('division3'), 0),
+        div4=Coalesce(Sum('division4'), 0),
+        div0=Coalesce(Sum('division0'), 0),
+        gpa_1_2=Count('id', filter=Q(gpa__gte=1.0, gpa__lt=2.0)),
+        gpa_2_3=Count('id', filter=Q(gpa__gte=2.0, gpa__lt=3.0)),
+        gpa_3_4=Count('id', filter=Q(gpa__gte=3.0, gpa__lt=4.0)),
+        gpa_4_plus=Count('id', filter=Q(gpa__gte=4.0)),
+    )
+
+    best_gpa = stats['best_gpa']
+    return {
+        'total_schools': stats['total_schools'],
+        'total_students': stats['total_students'],
+        'avg_gpa_all': round(stats['avg_gpa_all'] or 0, 2),
+        'best_gpa': round(best_gpa, 4) if best_gpa else 0,
+        'division_totals': {key: stats[key] for key in ('div1', 'div2', 'div3', 'div4', 'div0')},
+        'gpa_ranges': {
+            '1_2': stats['gpa_1_2'],
+            '2_3': stats['gpa_2_3'],
+            '3_4': stats['gpa_3_4'],
+            '4_plus': stats['gpa_4_plus'],
+        },
+    }
+
+
+class ResultWriter:
+    """
+    Persist scraped results for one exam/year in batches.
+
+    Existing schools and this year's results are loaded up front, so a result
+    that has not changed costs nothing, and each batch of changed results is
+    written in one transaction with a handful of bulk statements instead of
+    several queries per school. A rewritten result has its subject and
+    candidate rows replaced in the same transaction.
+    """
+
+    def __init__(self, exam: str, year: int, batch_size: int = 500):
+        self.exam = exam.upper()
+        self.year = year
+        self.batch_size = max(1, batch_size)
+        self.pending = []
+        self.updated = 0
+        self.kept = 0
+
+        self.schools = {school.code: school for school in School.objects.only("id", "code", "name", "region")}
+        self.existing = {
+            row["school__code"]: row
+            for row in ExamResult.objects.filter(exam=self.exam, year=year).values("school__code", *RESULT_FIELDS)
+        }
+        # Schools whose subject rows are stored; results scraped before those
+        # were kept are rewritten once to fill them in
+        self.detailed = set(
+            SubjectPerformance.objects.filter(exam=self.exam, year=year)
+            .values_list("result__school__code", flat=True).distinct()
+        )
+
+    @property
+    def changed(self) -> bool:
+        """
+        Whether anything was written. Schools are only created or relabelled
+        along with a rewritten result, so that covers them too.
+        """
+        return self.updated > 0
+
+    def unchanged(self, result):
+        stored = self.existing.get(result["code"])
+        school = self.schools.get(result["code"])
+        return (
+            stored is not None
+            and (result["code"] in self.detailed or not result.get("subjects"))
+            # A detected region only replaces an unknown one (see flush)
+            and (school.region != "Unknown" or result["region"] == "Unknown")
+            and all(stored[field] == result[key] for field, key in RESULT_FIELDS.items())
+        )
+
+    def add(self, result) -> bool:
+        """
+        Queue a result for writing. Returns False when the stored result is
+        already identical and nothing needs to be written.
+        """
+        if self.unchanged(result):
+            self.kept += 1
+            return False
+        self.pending.append(result)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        return True
+
+    @transaction.atomic
+    def flush(self):
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+
+        new_schools = []
+        relabelled = []
+        for result in batch:
+            school = self.schools.get(result["code"])
+            if school is None:
+                school = School(code=result["code"], name=result["name"], region=result["region"])
+                self.schools[school.code] = school
+                new_schools.append(school)
+            # Update region if it was previously unknown
+            elif school.region == "Unknown" and result["region"] != "Unknown":
+                school.region = result["region"]
+                relabelled.append(school)
+
+        School.objects.bulk_create(new_schools)
+        School.objects.bulk_update(relabelled, ["region"])
+
+        results = ExamResult.objects.bulk_create(
+            [
+                ExamResult(
+                    school=self.schools[result["code"]],
+                    exam=self.exam,
+                    year=self.year,
+                    **{field: result[key] for field, key in RESULT_FIELDS.items()},
+                )
+                for result in batch
+            ],
+            update_conflicts=True,
+            unique_fields=["school", "exam", "year"],
+            update_fields=list(RESULT_FIELDS),
+        )
+
+        self.write_details(batch, results)
+
+        for result in batch:
+            self.existing[result["code"]] = {field: result[key] for field, key in RESULT_FIELDS.items()}
+            if result.get("subjects"):
+                self.detailed.add(result["code"])
+        self.updated += len(batch)
+
+    def write_details(self, batch, results):
+        """
+        Replace the subject and candidate rows of the results just upserted.
+        """
+        result_ids = [obj.pk for obj in results]
+        SubjectPerformance.objects.filter(result_id__in=result_ids).delete()
+        StudentResult.objects.filter(result_id__in=result_ids).delete()
+
+        subjects = []
+        students = []
+        for result, obj in zip(batch, results):
+            for row in result.get("subjects", ()):
+                subjects.append((obj.pk, self.exam, self.year, *row))
+            for row in result.get("students", ()):
+                students.append((obj.pk, *row))
+        insert_rows(SubjectPerformance, SUBJECT_COLUMNS, subjects)
+        insert_rows(StudentResult, STUDENT_COLUMNS, students)
+
+
+# Column order of the compact rows built by api.parsing.compact_subjects/compact_students
+SUBJECT_COLUMNS = ["result", "exam", "year", "code", "name", "registered", "sat", "passed", "gpa"]
+STUDENT_COLUMNS = ["result", "cno", "sex", "aggregate", "division", "subjects"]
+
+
+def insert_rows(model, fields, rows):
+    """
+    Insert plain tuples with a single ``executemany``. Used for the detail
+    tables, which get hundreds of thousands of rows per year and where
+    building a model instance per row would cost more than the insert.
+    """
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})",
+            rows,
+        )
+
+
+RANKING_COLUMNS = [
+    "result", "school", "exam", "year", "region",
+    "national_rank", "region_rank", "percentile", "rank_change",
+]
+
+
+@transaction.atomic
+def rebuild_rankings(exam: str, year: int) -> int:
+    """
+    Recompute the materialized rankings of one exam/year and return how many
+    results were ranked. Results are ranked by GPA (lower is better), then
+    by number of candidates, then by id so ranks are stable. The old
+    snapshot is replaced in the same transaction, so readers never see a
+    partial ranking.
+    """
+    exam = exam.upper()
+    results = list(
+        ExamResult.objects.filter(exam=exam, year=year, gpa__gt=0)
+        .order_by("gpa", "-total", "id")
+        .values_list("id", "school_id", "school__region")
+    )
+    previous = dict(Ranking.objects.filter(exam=exam, year=year - 1).values_list("school_id", "national_rank"))
+
+    count = len(results)
+    region_counts = {}
+    rows = []
+    for rank, (result_id, school_id, region) in enumerate(results, start=1):
+        region_counts[region] = region_counts.get(region, 0) + 1
+        previous_rank = previous.get(school_id)
+        rows.append((
+            result_id, school_id, exam, year, region,
+            rank, region_counts[region],
+            round(100 * (count - rank + 1) / count, 2),
+            previous_rank - rank if previous_rank else None,
+        ))
+
+    Ranking.objects.filter(exam=exam, year=year).delete()
+    insert_rows(Ranking, RANKING_COLUMNS, rows)
+
+    # The following year's rank changes are relative to this year
+    ranks = {school_id: rank for rank, (_, school_id, _) in enumerate(results, start=1)}
+    following = Ranking.objects.filter(exam=exam, year=year + 1).values_list("id", "school_id", "national_rank")
+    updates = [
+        (ranks[school_id] - rank if school_id in ranks else None, ranking_id)
+        for ranking_id, school_id, rank in following
+    ]
+    if updates:
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"UPDATE {quote(Ranking._meta.db_table)} SET {quote('rank_change')} = %s WHERE {quote('id')} = %s",
+                updates,
+            )
+    return count
+
+
+SUMMARY_COLUMNS = ["total", "gpa", "division1", "division2", "division3", "division4", "division0"]
+
+
+def summarize(rows):
+    """
+    ResultSummary field values for ``(total, gpa, division1, ..., division0)``
+    rows of results with a valid GPA.
+    """
+    if not rows:
+        return {"schools": 0, "gpa_histogram": [0] * len(GPA_BINS)}
+    totals, gpas, *divisions = zip(*rows)
+    candidates = sum(totals)
+    histogram = [0] * len(GPA_BINS)
+    for gpa in gpas:
+        if gpa >= GPA_BINS[0]:
+            histogram[bisect_right(GPA_BINS, gpa) - 1] += 1
+    return {
+        "schools": len(rows),
+        "candidates": candidates,
+        **{f"division{number}": sum(counts) for number, counts in zip((1, 2, 3, 4, 0), divisions)},
+        "mean_gpa": round(sum(gpas) / len(gpas), 4),
+        "weighted_gpa": round(sum(gpa * total for gpa, total in zip(gpas, totals)) / candidates, 4) if candidates else None,
+        "median_gpa": round(statistics.median(gpas), 4),
+        "best_gpa": min(gpas),
+        "gpa_histogram": histogram,
+    }
+
+
+@transaction.atomic
+def refresh_summaries(exam: str, year: int) -> int:
+    """
+    Recompute the regional and national summaries of one exam/year from a
+    single read of its results and return how many regions were summarized.
+    The old rows are replaced in the same transaction.
+    """
+    exam = exam.upper()
+    regions = {}
+    results = ExamResult.objects.filter(exam=exam, year=year, gpa__gt=0).values_list("school__region", *SUMMARY_COLUMNS)
+    for region, *row in results:
+        regions.setdefault(region, []).append(row)
+    everything = [row for rows in regions.values() for row in rows]
+
+    ResultSummary.objects.filter(exam=exam, year=year).delete()
+    ResultSummary.objects.bulk_create([
+        ResultSummary(exam=exam, year=year, region=region, **summarize(rows))
+        for region, rows in [("", everything), *sorted(regions.items())]
+    ])
+    return len(regions)
+
+
+def data_generation():
+    """
+    Return ``(generation, updated_at)`` of the stored results, ``(0, None)``
+    before the first scrape
+    """
+    row = DataGeneration.objects.filter(pk=1).values_list("generation", "updated_at").first()
+    return row or (0, None)
+
+
+def bump_data_generation():
+    """
+    Record that the stored results changed, invalidating cached responses
+    """
+    DataGeneration.objects.get_or_create(pk=1)
+    DataGeneration.objects.filter(pk=1).update(generation=F("generation") + 1, updated_at=timezone.now())
@@ -1,3 +1,961 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from unittest import skipUnless
+from io import StringIO
 
-# Create your tests here.
+from bs4 import BeautifulSoup
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import caching, exports, jobs, legacy_parsing, metrics, samples
+from .caching import response_cache
+from .fetching import HttpClient
+from .management.commands.scrape_necta import BASE_URL
+from .models import School, ExamResult, Ranking, ResultSummary, ScrapeJob, StudentResult, SubjectPerformance
+from .parsing import detect_region, parse_school_page
+from .serializers import ExamResultSerializer, SchoolSerializer
+from .services import (
+    GPA_BINS, ResultWriter, bump_data_generation, data_generation, ranking_statistics, rebuild_rankings, refresh_summaries,
+)
+
+
+class ScrapeNectaTests(TestCase):
+    """Runs scrape_necta end to end against a local stand-in for the NECTA site."""
+
+    exam = "csee"
+    year = 2023
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.schools = samples.make_schools(12)
+        samples.write_corpus(self.tmp.name, self.exam, self.year, self.schools)
+        # The ranking file is written to the working directory
+        cwd = os.getcwd()
+        os.chdir(self.tmp.name)
+        self.addCleanup(os.chdir, cwd)
+        response_cache().clear()
+
+    def scrape(self, base_url=None, **options):
+        if base_url is None:
+            server = {key: options.pop(key) for key in ("latency", "failures") if key in options}
+            with samples.serve_corpus(self.tmp.name, **server) as base_url:
+                return self.scrape(base_url, **options)
+        out = StringIO()
+        call_command("scrape_necta", exam=self.exam, year=self.year, base_url=base_url, stdout=out, **options)
+        return out.getvalue()
+
+    def ranking_file(self):
+        with open(f"school_results_{self.year}_{self.exam}.txt", encoding="utf-8") as f:
+            return f.read()
+
+    def test_scrape_stores_every_school(self):
+        self.scrape()
+        self.assertEqual(School.objects.count(), len(self.schools))
+        self.assertEqual(Ranking.objects.filter(exam="CSEE", year=self.year).count(), len(self.schools))
+        result = ExamResult.objects.get(school__code=self.schools[0]["code"])
+        self.assertEqual(result.exam, "CSEE")
+        self.assertEqual(result.gpa, self.schools[0]["gpa"])
+        self.assertEqual(result.division1, self.schools[0]["divisions"][0])
+        self.assertEqual(result.total, sum(self.schools[0]["divisions"]))
+        self.assertEqual(data_generation()[0], 1)
+        national = ResultSummary.objects.get(exam="CSEE", year=self.year, region="")
+        self.assertEqual(national.schools, len(self.schools))
+
+    def test_subject_and_candidate_rows_are_stored(self):
+        self.scrape()
+        school = self.schools[0]
+        candidates = min(sum(school["divisions"]), 60)
+        self.assertEqual(SubjectPerformance.objects.count(), len(self.schools) * len(samples.SUBJECTS))
+        self.assertEqual(StudentResult.objects.filter(result__school__code=school["code"]).count(), candidates)
+
+        stored = School.objects.get(code=school["code"])
+        response = self.client.get(f"/api/school/{stored.id}/students/", {"exam_type": "csee", "year": self.year})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["students"]), candidates)
+        self.assertEqual(len(response.data["subjects"]), len(samples.SUBJECTS))
+        self.assertEqual(response.data["students"][0]["cno"], f"{school['code']}/0001")
+
+        response = self.client.get(f"/api/subjects/csee/{self.year}/033/", {"limit": 5})
+        gpas = [row["gpa"] for row in response.data["results"]]
+        self.assertEqual(len(gpas), 5)
+        self.assertEqual(gpas, sorted(gpas))
+        self.assertEqual(response.data["results"][0]["rank"], 1)
+
+        # Out-of-range limits are clamped rather than failing
+        for limit in (-5, 0):
+            response = self.client.get(f"/api/subjects/csee/{self.year}/033/", {"limit": limit, "min_sat": -3})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data["results"]), 1)
+
+        response = self.client.get(f"/api/subjects/csee/{self.year}/")
+        self.assertEqual([row["code"] for row in response.data["subjects"]], [code for code, _ in samples.SUBJECTS])
+        self.assertEqual(response.data["subjects"][0]["centres"], len(self.schools))
+
+        # A second run with unchanged pages leaves the detail rows alone
+        self.scrape()
+        self.assertEqual(StudentResult.objects.filter(result__school__code=school["code"]).count(), candidates)
+
+    def test_concurrent_scrape_matches_serial(self):
+        self.scrape(workers=1)
+        serial = self.ranking_file()
+        output = self.scrape(workers=6, per_host=3, latency=0.02)
+        self.assertEqual(self.ranking_file(), serial)
+        self.assertIn("pages/sec", output)
+        self.assertEqual(ExamResult.objects.count(), len(self.schools))
+
+    def test_process_pool_parsing_matches_serial(self):
+        self.scrape()
+        serial = self.ranking_file()
+        self.scrape(workers=4, parse_workers=2)
+        self.assertEqual(self.ranking_file(), serial)
+        self.assertEqual(ExamResult.objects.count(), len(self.schools))
+
+    def test_rescrape_with_cache_skips_unchanged_pages(self):
+        cache_dir = os.path.join(self.tmp.name, "cache")
+        with samples.serve_corpus(self.tmp.name) as base_url:
+            output = self.scrape(base_url, cache_dir=cache_dir)
+            self.assertIn(f"Pages: {len(self.schools)} fetched, 0 unchanged", output)
+
+            # Change one school's GPA and move its mtime so Last-Modified changes
+            changed = dict(self.schools[3], gpa=1.2345)
+            root = os.path.join(self.tmp.name, "results", str(self.year), self.exam)
+            path = os.path.join(root, "results", f"{changed['code'].lower()}.htm")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(samples.render_school_page(changed, self.exam, self.year))
+            mtime = os.stat(path).st_mtime + 10
+            os.utime(path, (mtime, mtime))
+
+            output = self.scrape(base_url, cache_dir=cache_dir)
+
+        self.assertIn(f"Pages: 1 fetched, {len(self.schools) - 1} unchanged, 0 failed.", output)
+        self.assertIn(f"Results: 1 updated, {len(self.schools) - 1} unchanged.", output)
+        self.assertEqual(ExamResult.objects.get(school__code=changed["code"]).gpa, 1.2345)
+        self.assertIn(f"{changed['code']} {changed['name']}", self.ranking_file().splitlines()[2])
+
+    def test_rescrape_keeps_results_of_relabelled_schools(self):
+        self.scrape()
+        School.objects.update(region="Mara")
+        output = self.scrape()
+        self.assertIn(f"Results: 0 updated, {len(self.schools)} unchanged.", output)
+        self.assertEqual(set(School.objects.values_list("region", flat=True)), {"Mara"})
+
+    def test_unchanged_rescrape_keeps_cached_responses(self):
+        self.scrape()
+        generation = data_generation()
+        etag = self.client.get(f"/api/rankings/{self.exam}/{self.year}/")["ETag"]
+        output = self.scrape()
+        self.assertIn("Results: 0 updated", output)
+        self.assertIn("Rankings unchanged.", output)
+        self.assertEqual(data_generation(), generation)
+        response = self.client.get(f"/api/rankings/{self.exam}/{self.year}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_record_then_replay_offline(self):
+        record_dir = os.path.join(self.tmp.name, "recorded")
+        self.scrape(workers=3, record=record_dir)
+        online = self.ranking_file()
+        ExamResult.objects.all().delete()
+
+        output = self.scrape(base_url=BASE_URL, source=record_dir)
+        self.assertEqual(self.ranking_file(), online)
+        self.assertEqual(ExamResult.objects.count(), len(self.schools))
+        self.assertIn(f"Pages: {len(self.schools)} fetched", output)
+
+    def test_queued_job_run_by_worker(self):
+        response = self.client.post("/api/scrape/", {"exam_type": "csee", "year": self.year})
+        self.assertEqual(response.status_code, 202)
+        job = response.json()["job"]
+        self.assertEqual((job["exam"], job["status"]), ("CSEE", "queued"))
+
+        # The same exam/year is not queued twice while the first is pending
+        again = self.client.post("/api/scrape/", {"exam_type": "CSEE", "year": self.year}).json()
+        self.assertEqual((again["status"], again["job"]["id"]), ("scraping_already_in_progress", job["id"]))
+        self.assertEqual(self.client.post("/api/scrape/", {"exam_type": "csee", "year": 2022}).status_code, 202)
+        ScrapeJob.objects.filter(year=2022).delete()
+
+        with samples.serve_corpus(self.tmp.name) as base_url:
+            call_command("scrape_worker", once=True, base_url=base_url, workers=4, stdout=StringIO())
+        self.assertEqual(ExamResult.objects.count(), len(self.schools))
+
+        data = self.client.get("/api/scrape/status/", {"job": job["id"]}).json()["job"]
+        self.assertEqual(data["status"], "done")
+        self.assertEqual((data["pages_done"], data["pages_total"], data["progress"]), (12, 12, 100.0))
+        status = self.client.get("/api/scrape/status/").json()
+        self.assertEqual((status["scraping_in_progress"], status["jobs"]), (False, []))
+        self.assertEqual(status["recent"][0]["id"], job["id"])
+
+        # Finished jobs can be queued again
+        self.assertEqual(self.client.post("/api/scrape/", {"exam_type": "csee", "year": self.year}).status_code, 202)
+
+    def test_invalid_scrape_requests_are_not_queued(self):
+        for data in (
+            {"exam_type": "foo", "year": self.year},
+            {"exam_type": "csee", "year": "20x3"},
+            {"exam_type": "csee", "year": 2023.5},
+            {"exam_type": "csee"},
+        ):
+            response = self.client.post("/api/scrape/", data, content_type="application/json")
+            self.assertEqual(response.status_code, 400, data)
+        self.assertFalse(ScrapeJob.objects.exists())
+
+    def test_failed_and_stale_jobs(self):
+        job, _ = jobs.enqueue("csee", self.year)
+        with samples.serve_corpus(os.path.join(self.tmp.name, "missing")) as base_url:
+            call_command("scrape_worker", once=True, base_url=base_url, stdout=StringIO())
+        job.refresh_from_db()
+        self.assertEqual(job.status, "failed")
+        self.assertIn("Failed to fetch", job.error)
+
+        job, _ = jobs.enqueue("csee", self.year)
+        self.assertEqual(jobs.claim_next("test").id, job.id)
+        self.assertIsNone(jobs.claim_next("test"))
+        self.assertEqual(jobs.fail_stale(60), 0)
+        ScrapeJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(jobs.fail_stale(60), 1)
+        self.assertTrue(jobs.enqueue("csee", self.year)[1])
+
+    def test_batch_scrape(self):
+        corpora = {("csee", 2023): self.schools}
+        for exam, year in [("acsee", 2023), ("csee", 2022), ("acsee", 2022)]:
+            corpora[exam, year] = samples.make_schools(8 if exam == "acsee" else 12, seed=year)
+            samples.write_corpus(self.tmp.name, exam, year, corpora[exam, year])
+
+        with samples.serve_corpus(self.tmp.name) as base_url:
+            out = StringIO()
+            call_command(
+                "scrape_batch", exams=["csee", "acsee"], years="2021-2023", workers=6,
+                base_url=base_url, progress=0, stdout=out,
+            )
+        output = out.getvalue()
+        self.assertIn("Skipping CSEE 2021", output)
+        self.assertIn("Scraping 40 school pages for 4 exam/years", output)
+        self.assertIn("ETA", output)
+        self.assertIn("Pages: 40 fetched, 0 unchanged, 0 failed.", output)
+
+        for (exam, year), schools in corpora.items():
+            stored = ExamResult.objects.filter(exam=exam.upper(), year=year)
+            self.assertEqual(stored.count(), len(schools))
+            self.assertEqual(Ranking.objects.filter(exam=exam.upper(), year=year).count(), len(schools))
+            self.assertEqual(ResultSummary.objects.get(exam=exam.upper(), year=year, region="").schools, len(schools))
+        # 2023 is ranked against 2022 for the schools in both
+        self.assertTrue(Ranking.objects.filter(exam="CSEE", year=2023, rank_change__isnull=False).exists())
+        self.assertEqual(data_generation()[0], 4)
+
+        # Running the same batch again changes nothing and keeps cached responses
+        with samples.serve_corpus(self.tmp.name) as base_url:
+            out = StringIO()
+            call_command(
+                "scrape_batch", exams=["csee", "acsee"], years="2022-2023", base_url=base_url, progress=0, stdout=out,
+            )
+        self.assertIn("CSEE 2023: 12 results unchanged, rankings kept.", out.getvalue())
+        self.assertEqual(data_generation()[0], 4)
+
+    def test_batch_scrape_rejects_reversed_years(self):
+        for years in ("2024-2015", "2019,2023-2021"):
+            with self.assertRaisesMessage(CommandError, "Invalid year range"):
+                call_command("scrape_batch", years=years, stdout=StringIO())
+
+    def test_rate_limit(self):
+        client = HttpClient(rate=20)
+        with samples.serve_corpus(self.tmp.name) as base_url:
+            url = base_url.format(year=self.year, exam=self.exam) + "index.htm"
+            started = time.monotonic()
+            for _ in range(5):
+                client.get(url)
+        self.assertGreaterEqual(time.monotonic() - started, 4 / 20)
+        client.close()
+
+    def test_transient_errors_are_retried(self):
+        output = self.scrape(workers=4, failures=1, backoff=0)
+        self.assertEqual(ExamResult.objects.count(), len(self.schools))
+        self.assertNotIn("Failed to fetch", output)
+        self.assertIn(f"{len(self.schools) + 1} retries", output)
+
+
+class DetectRegionTests(SimpleTestCase):
+
+    def test_whole_words_only(self):
+        self.assertEqual(detect_region("MARAMBA SECONDARY SCHOOL, KIGOMA", ""), "Kigoma")
+        self.assertEqual(detect_region("MARAMBA", "MARAMBA"), "Unknown")
+
+    def test_header_wins_over_body(self):
+        body = "ARUSHA ARUSHA ARUSHA"
+        self.assertEqual(detect_region(body + " MBEYA", "", header="S0101 TUKUYU - MBEYA"), "Mbeya")
+        self.assertEqual(detect_region("MBEYA " + body, ""), "Arusha")
+
+    def test_districts_map_to_regions(self):
+        self.assertEqual(detect_region("", "", header="KIBAHA TOWN COUNCIL"), "Pwani")
+        self.assertEqual(detect_region("", "MOSHI TECHNICAL"), "Kilimanjaro")
+        self.assertEqual(detect_region("Dar es Salaam", ""), "Dar es Salaam")
+
+
+class ResultWriterTests(TestCase):
+
+    def result(self, school, **changes):
+        return dict(samples.school_result(school), **changes)
+
+    def test_batches_are_bulk_upserted(self):
+        schools = samples.make_schools(250)
+        School.objects.create(code=schools[0]["code"], name=schools[0]["name"])  # region Unknown
+
+        # Three preloads, then per batch of 100 a savepoint, one school
+        # insert, the results upsert (split in two by SQLite's variable
+        # limit), two deletes of old detail rows and the release; only the
+        # first batch has a region to update.
+        with self.assertNumQueries(24):
+            writer = ResultWriter("csee", 2023, batch_size=100)
+            for school in schools:
+                writer.add(self.result(school))
+            writer.flush()
+
+        self.assertEqual(writer.updated, 250)
+        self.assertEqual(ExamResult.objects.filter(exam="CSEE", year=2023).count(), 250)
+        self.assertEqual(School.objects.get(code=schools[0]["code"]).region, schools[0]["region"])
+
+        writer = ResultWriter("csee", 2023)
+        self.assertFalse(writer.add(self.result(schools[1])))
+        self.assertTrue(writer.add(self.result(schools[2], gpa=1.0)))
+        writer.flush()
+        self.assertEqual((writer.updated, writer.kept), (1, 1))
+        self.assertEqual(ExamResult.objects.get(school__code=schools[2]["code"]).gpa, 1.0)
+        self.assertEqual(ExamResult.objects.count(), 250)
+
+    def test_known_region_mismatch_is_kept(self):
+        school = samples.make_schools(1)[0]
+        writer = ResultWriter("csee", 2023)
+        writer.add(self.result(school, region="Unknown"))
+        writer.flush()
+        School.objects.filter(code=school["code"]).update(region="Mara")
+
+        # The stored region is kept, so the detected one is no reason to rewrite
+        writer = ResultWriter("csee", 2023)
+        self.assertFalse(writer.add(self.result(school, region="Arusha")))
+        writer.flush()
+        self.assertEqual((writer.updated, writer.kept), (0, 1))
+        self.assertEqual(School.objects.get(code=school["code"]).region, "Mara")
+
+        # An unknown stored region is still filled in
+        School.objects.filter(code=school["code"]).update(region="Unknown")
+        writer = ResultWriter("csee", 2023)
+        self.assertTrue(writer.add(self.result(school, region="Arusha")))
+        writer.flush()
+        self.assertEqual(School.objects.get(code=school["code"]).region, "Arusha")
+
+
+# Cached endpoints look up the data generation once per request (see api.caching)
+GENERATION_QUERIES = 1
+
+
+class StoredResultsTestCase(TestCase):
+    """
+    A year of synthetic results for ``school_count`` schools, ranked and
+    summarized, plus one result without a valid GPA when ``unranked`` is
+    set. The response cache is emptied before each test.
+    """
+
+    exam = "csee"
+    year = 2023
+    school_count = 0
+    unranked = False
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schools = samples.make_schools(cls.school_count)
+        extra = [dict(samples.make_schools(cls.school_count + 1)[-1], gpa=0.0)] if cls.unranked else []
+        cls.store(cls.schools + extra)
+
+    @classmethod
+    def store(cls, schools, year=None, rank=True):
+        year = year or cls.year
+        writer = ResultWriter(cls.exam, year)
+        for school in schools:
+            writer.add(samples.school_result(school))
+        writer.flush()
+        if rank:
+            rebuild_rankings(cls.exam, year)
+            refresh_summaries(cls.exam, year)
+
+    def setUp(self):
+        response_cache().clear()
+
+
+class RankingsTests(StoredResultsTestCase):
+
+    school_count = 60
+    unranked = True
+
+    def test_statistics_in_two_queries(self):
+        with self.assertNumQueries(2 + GENERATION_QUERIES):
+            response = self.client.get("/api/rankings/csee/2023/")
+        data = response.json()
+
+        gpas = sorted(school["gpa"] for school in self.schools)
+        self.assertEqual(data["total_schools"], 60)
+        self.assertEqual(data["total_students"], sum(sum(school["divisions"]) for school in self.schools))
+        self.assertEqual(data["best_gpa"], gpas[0])
+        self.assertEqual(data["avg_gpa_all"], round(sum(gpas) / len(gpas), 2))
+        self.assertEqual(data["division_totals"]["div1"], sum(school["divisions"][0] for school in self.schools))
+        self.assertEqual(data["gpa_ranges"], {
+            "1_2": sum(1.0 <= gpa < 2.0 for gpa in gpas),
+            "2_3": sum(2.0 <= gpa < 3.0 for gpa in gpas),
+            "3_4": sum(3.0 <= gpa < 4.0 for gpa in gpas),
+            "4_plus": sum(gpa >= 4.0 for gpa in gpas),
+        })
+        self.assertEqual([row["gpa"] for row in data["results"]], gpas)
+        self.assertEqual(data["results"][-1]["rank"], 60)
+
+    def test_rankings_are_materialized(self):
+        ranked = sorted(self.schools, key=lambda school: (school["gpa"], -sum(school["divisions"])))
+        rankings = list(Ranking.objects.filter(exam="CSEE", year=2023).select_related("school"))
+        self.assertEqual([ranking.school.code for ranking in rankings], [school["code"] for school in ranked])
+        self.assertEqual(rankings[0].percentile, 100.0)
+        self.assertIsNone(rankings[0].rank_change)
+
+        region = ranked[10]["region"]
+        in_region = [school["code"] for school in ranked if school["region"] == region]
+        ranking = Ranking.objects.get(school__code=ranked[10]["code"])
+        self.assertEqual(ranking.region_rank, in_region.index(ranked[10]["code"]) + 1)
+
+        # A later year's rank changes are against this year, and follow a rebuild of it
+        writer = ResultWriter("csee", 2024)
+        for school in self.schools:
+            writer.add(samples.school_result(dict(school, gpa=5.0 - school["gpa"] / 2)))
+        writer.flush()
+        rebuild_rankings("csee", 2024)
+        last = Ranking.objects.get(exam="CSEE", year=2024, school__code=ranked[-1]["code"])
+        self.assertEqual(last.national_rank, 1)
+        self.assertEqual(last.rank_change, 60 - 1)
+
+        ExamResult.objects.filter(exam="CSEE", year=2023, school__code=ranked[-1]["code"]).update(gpa=1.0)
+        rebuild_rankings("csee", 2023)
+        last.refresh_from_db()
+        self.assertEqual(last.rank_change, 0)
+
+        data = self.client.get(f"/api/school/{last.school_id}/").json()
+        self.assertEqual([(row["year"], row["national_rank"]) for row in data["rankings"]], [(2024, 1), (2023, 1)])
+
+    def test_cursor_pagination(self):
+        ranked = sorted(self.schools, key=lambda school: (school["gpa"], -sum(school["divisions"])))
+        codes, url = [], "/api/rankings/csee/2023/?page_size=25"
+        while url:
+            with self.assertNumQueries(1 + GENERATION_QUERIES):
+                data = self.client.get(url).json()
+            self.assertNotIn("total_schools", data)
+            codes.extend(row["school"]["code"] for row in data["results"])
+            url = data["next"]
+        self.assertEqual(codes, [school["code"] for school in ranked])
+
+        # A region pages by region rank, and its summary covers only that region
+        region = ranked[0]["region"]
+        in_region = [school for school in ranked if school["region"] == region]
+        data = self.client.get(f"/api/rankings/csee/2023/?page_size=2&region={region.lower()}").json()
+        self.assertEqual([row["region_rank"] for row in data["results"]], [1, 2][:len(in_region)])
+        self.assertEqual(data["results"][0]["school"]["code"], in_region[0]["code"])
+        self.assertEqual(data["region"], region)
+
+        summary = self.client.get(f"/api/rankings/csee/2023/summary/?region={region}").json()
+        self.assertEqual(summary["total_schools"], len(in_region))
+        self.assertEqual(summary["best_gpa"], in_region[0]["gpa"])
+        self.assertEqual(
+            self.client.get("/api/rankings/csee/2023/summary/").json()["total_schools"], 60
+        )
+
+    def test_invalid_page_size(self):
+        for page_size in ("0", "-1", "abc", ""):
+            response = self.client.get(f"/api/rankings/csee/2023/?page_size={page_size}")
+            self.assertEqual(response.status_code, 400, page_size)
+            self.assertEqual(response.json(), {"error": "page_size must be a positive integer"})
+        # Sizes above the maximum are still capped rather than rejected
+        data = self.client.get("/api/rankings/csee/2023/?page_size=1000").json()
+        self.assertEqual(len(data["results"]), 60)
+
+    def test_flat_rows_match_serializers(self):
+        data = self.client.get("/api/results/", {"exam_type": "csee", "year": 2023}).json()
+        results = ExamResult.objects.select_related("school").order_by("gpa", "-total")[:20]
+        self.assertEqual(data["results"], json.loads(json.dumps(ExamResultSerializer(results, many=True).data)))
+
+        ranking = Ranking.objects.select_related("school", "result").get(exam="CSEE", year=2023, national_rank=1)
+        row = self.client.get("/api/rankings/csee/2023/?page_size=1").json()["results"][0]
+        self.assertEqual(row["school"], SchoolSerializer(ranking.school).data)
+        self.assertEqual(
+            (row["rank"], row["region_rank"], row["gpa"], row["total"]),
+            (1, 1, ranking.result.gpa, ranking.result.total),
+        )
+
+    def test_columns_layout(self):
+        rows = self.client.get("/api/rankings/csee/2023/").json()["results"]
+        data = self.client.get("/api/rankings/csee/2023/", {"layout": "columns"}).json()
+        self.assertEqual(data["total_schools"], 60)
+        columns = data["results"]
+        self.assertEqual(columns["fields"][:5], ["rank", "region_rank", "percentile", "rank_change", "school.id"])
+        self.assertEqual(len(columns["rows"]), 60)
+        first = dict(zip(columns["fields"], columns["rows"][0]))
+        self.assertEqual((first["rank"], first["school.code"], first["gpa"]), (1, rows[0]["school"]["code"], rows[0]["gpa"]))
+
+        data = self.client.get("/api/results/", {"layout": "columns", "year": 2023}).json()
+        self.assertEqual(data["count"], 61)
+        self.assertEqual(len(data["results"]["rows"]), 20)
+
+    def test_empty_year(self):
+        data = self.client.get("/api/rankings/acsee/2023/").json()
+        self.assertEqual(data["results"], [])
+        self.assertEqual((data["total_schools"], data["total_students"], data["best_gpa"]), (0, 0, 0))
+
+
+class ResponseCacheTests(StoredResultsTestCase):
+
+    school_count = 5
+
+    def setUp(self):
+        super().setUp()
+        caching.stats.reset()
+        bump_data_generation()
+
+    def test_cached_until_next_scrape(self):
+        first = self.client.get("/api/rankings/csee/2023/")
+        with self.assertNumQueries(GENERATION_QUERIES):
+            second = self.client.get("/api/rankings/csee/2023/")
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["Content-Type"], first["Content-Type"])
+
+        # Query strings are cached separately
+        self.assertEqual(self.client.get("/api/rankings/csee/2023/?page_size=2")["X-Cache"], "MISS")
+
+        ExamResult.objects.filter(school__code="S0001").update(gpa=1.0)
+        rebuild_rankings("csee", 2023)
+        self.assertEqual(self.client.get("/api/rankings/csee/2023/")["X-Cache"], "HIT")
+        bump_data_generation()
+        response = self.client.get("/api/rankings/csee/2023/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["results"][0]["school"]["code"], "S0001")
+
+        self.assertEqual(caching.stats.summary(), {"rankings": {"hits": 2, "misses": 3}})
+
+    def test_conditional_requests(self):
+        first = self.client.get("/api/rankings/csee/2023/")
+        self.assertEqual(first["Cache-Control"], "no-cache")
+        with self.assertNumQueries(GENERATION_QUERIES):
+            response = self.client.get("/api/rankings/csee/2023/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        response = self.client.get("/api/rankings/csee/2023/", HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+        self.assertEqual(response.status_code, 304)
+
+        # Each URL has its own ETag
+        other = self.client.get("/api/rankings/csee/2023/summary/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(other.status_code, 200)
+        self.assertNotEqual(other["ETag"], first["ETag"])
+
+        bump_data_generation()
+        response = self.client.get("/api/rankings/csee/2023/", HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], first["ETag"])
+
+    def test_errors_not_cached(self):
+        self.client.get("/api/school/999/")
+        self.assertEqual(self.client.get("/api/school/999/").status_code, 404)
+        self.assertEqual(caching.stats.summary(), {"school_detail": {"hits": 0, "misses": 2}})
+
+
+class ExportTests(StoredResultsTestCase):
+
+    school_count = 30
+    unranked = True
+
+    def test_csv_in_rank_order(self):
+        response = self.client.get("/api/export/", {"exam_type": "csee", "year": 2023})
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn('filename="results_csee_2023.csv"', response["Content-Disposition"])
+        rows = list(csv.DictReader(StringIO(b"".join(response.streaming_content).decode("utf-8"))))
+
+        ranked = sorted(self.schools, key=lambda school: (school["gpa"], -sum(school["divisions"])))
+        self.assertEqual([row["code"] for row in rows[:-1]], [school["code"] for school in ranked])
+        self.assertEqual((rows[0]["rank"], rows[0]["gpa"]), ("1", str(ranked[0]["gpa"])))
+        self.assertEqual((rows[-1]["code"], rows[-1]["rank"]), ("S0031", ""))
+
+    def test_ndjson_by_region(self):
+        region = self.schools[0]["region"]
+        response = self.client.get("/api/export/", {"format": "ndjson", "region": region.lower()})
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual(
+            sorted(row["code"] for row in rows),
+            sorted(school["code"] for school in self.schools if school["region"] == region),
+        )
+        self.assertEqual(set(rows[0]), set(exports.EXPORT_COLUMNS))
+        self.assertEqual(self.client.get("/api/export/", {"format": "xml"}).status_code, 400)
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "results.csv")
+            out = StringIO()
+            call_command("export_results", exam="csee", year=2023, output=path, stdout=out)
+            self.assertIn("Exported 31 results", out.getvalue())
+            with open(path, encoding="utf-8", newline="") as f:
+                self.assertEqual(len(list(csv.DictReader(f))), 31)
+
+        out = StringIO()
+        call_command("export_results", format="ndjson", year=2022, stdout=out)
+        self.assertEqual(out.getvalue(), "")
+
+
+@skipUnless(connection.vendor == "sqlite", "reads SQLite query plans")
+class QueryPlanTests(TestCase):
+    """The hot queries are answered from indexes, without sorting."""
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(f"INDEX {index}", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_results_by_exam_and_year(self):
+        index = ExamResult._meta.indexes[0].name
+        results = ExamResult.objects.filter(exam="CSEE", year=2023)
+        self.assertUsesIndex(results.select_related("school").order_by("gpa", "-total"), index)
+        self.assertUsesIndex(results.filter(gpa__gt=0).order_by("gpa", "-total", "id"), index)
+        self.assertIn("gpa>?", results.filter(gpa__gt=0).explain())
+
+    def test_region_filter(self):
+        plan = ExamResult.objects.filter(school__region_key="mwanza").explain()
+        self.assertRegex(plan, r"SEARCH api_school USING (COVERING )?INDEX api_school_region_key_\w+ \(region_key=\?\)")
+
+    def test_rankings(self):
+        national, regional = (index.name for index in Ranking._meta.indexes)
+        rankings = Ranking.objects.filter(exam="CSEE", year=2023)
+        self.assertUsesIndex(rankings.order_by("national_rank"), national)
+        self.assertUsesIndex(rankings.filter(region="Mwanza").order_by("region_rank"), regional)
+
+
+class SummaryTests(StoredResultsTestCase):
+
+    school_count = 40
+    unranked = True
+
+    def test_summaries(self):
+        regions = sorted({school["region"] for school in self.schools})
+        self.assertEqual(refresh_summaries("csee", 2023), len(regions))
+        national = ResultSummary.objects.get(exam="CSEE", year=2023, region="")
+        gpas = sorted(school["gpa"] for school in self.schools)
+        totals = [sum(school["divisions"]) for school in self.schools]
+        self.assertEqual(national.schools, 40)
+        self.assertEqual(national.candidates, sum(totals))
+        self.assertEqual(national.division0, sum(school["divisions"][4] for school in self.schools))
+        self.assertEqual(national.median_gpa, round((gpas[19] + gpas[20]) / 2, 4))
+        self.assertEqual(national.best_gpa, gpas[0])
+        self.assertAlmostEqual(
+            national.weighted_gpa, sum(school["gpa"] * total for school, total in zip(self.schools, totals)) / sum(totals), 3,
+        )
+        self.assertEqual(sum(national.gpa_histogram), 40)
+        self.assertEqual(national.gpa_histogram[0], sum(GPA_BINS[0] <= gpa < GPA_BINS[1] for gpa in gpas))
+
+        region = ResultSummary.objects.get(exam="CSEE", year=2023, region=regions[0])
+        self.assertEqual(region.schools, sum(school["region"] == regions[0] for school in self.schools))
+
+    def test_statistics_match_aggregate(self):
+        region = self.schools[0]["region"]
+        summarized = [ranking_statistics("csee", 2023), ranking_statistics("csee", 2023, region.lower())]
+        ResultSummary.objects.all().delete()
+        aggregated = [ranking_statistics("csee", 2023), ranking_statistics("csee", 2023, region.lower())]
+        self.assertEqual(summarized, aggregated)
+
+    def test_empty_statistics_match(self):
+        # A region with no results reads zeros from the aggregate fallback too
+        aggregated = ranking_statistics("csee", 2023, "nowhere")
+        self.assertEqual(aggregated["total_students"], 0)
+        self.assertEqual(aggregated["division_totals"], {"div1": 0, "div2": 0, "div3": 0, "div4": 0, "div0": 0})
+        ResultSummary.objects.create(exam="CSEE", year=2023, region="Nowhere", gpa_histogram=[0] * len(GPA_BINS))
+        self.assertEqual(ranking_statistics("csee", 2023, "nowhere"), aggregated)
+
+    def test_regions_endpoint(self):
+        with self.assertNumQueries(1 + GENERATION_QUERIES):
+            data = self.client.get("/api/regions/csee/2023/").json()
+        self.assertEqual(data["gpa_bins"], GPA_BINS)
+        self.assertEqual(data["national"]["schools"], 40)
+        self.assertEqual(sum(region["schools"] for region in data["regions"]), 40)
+        self.assertEqual(data["regions"], sorted(data["regions"], key=lambda region: region["region"]))
+        self.assertIsNone(self.client.get("/api/regions/csee/2020/").json()["national"])
+
+
+class TrendsTests(StoredResultsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.schools = samples.make_schools(6)
+        for year in (2021, 2022, 2023):
+            cls.store([
+                dict(school, gpa=school["gpa"] + (year - 2021) / 10)
+                for school in cls.schools
+                if year != 2022 or school["code"] != "S0002"  # no result that year
+            ], year)
+        cls.ids = dict(School.objects.values_list("code", "id"))
+
+    def trends(self, **params):
+        return self.client.get("/api/trends/", {"exam": "csee", **params})
+
+    def test_series_in_one_query(self):
+        ids = f"{self.ids['S0001']},{self.ids['S0002']}"
+        with self.assertNumQueries(1 + GENERATION_QUERIES):
+            data = self.trends(schools=ids).json()
+        self.assertEqual(data["years"], [2021, 2022, 2023])
+        first, second = data["schools"]
+        school = self.schools[0]
+        self.assertEqual(first["code"], "S0001")
+        self.assertEqual(first["gpa"], [round(school["gpa"] + step / 10, 4) for step in range(3)])
+        self.assertEqual(first["gpa_change"], [None, 0.1, 0.1])
+        self.assertEqual(first["total"], [sum(school["divisions"])] * 3)
+        share = round(100 * school["divisions"][0] / sum(school["divisions"]), 2)
+        self.assertEqual(first["division_share"]["division1"], [share] * 3)
+        self.assertEqual(first["division_share_change"]["division1"], [None, 0.0, 0.0])
+        ranking = Ranking.objects.get(school_id=self.ids["S0001"], year=2023)
+        self.assertEqual(first["national_rank"][2], ranking.national_rank)
+        self.assertEqual(first["rank_change"][2], ranking.rank_change)
+
+        self.assertEqual(second["gpa"][1], None)
+        self.assertEqual(second["gpa_change"], [None, None, None])
+        self.assertEqual(second["rank_change"][2], None)
+
+    def test_region(self):
+        region = self.schools[0]["region"]
+        data = self.trends(region=region.upper(), **{"from": 2022}).json()
+        self.assertEqual(data["region"], region)
+        self.assertEqual(data["years"], [2022, 2023])
+        self.assertEqual(
+            [school["code"] for school in data["schools"]],
+            sorted(school["code"] for school in self.schools if school["region"] == region),
+        )
+        # An empty schools list does not filter the region down to nothing
+        self.assertEqual(self.trends(schools="", region=region, **{"from": 2022}).json(), data)
+
+    def test_bad_requests(self):
+        self.assertEqual(self.trends().status_code, 400)
+        self.assertEqual(self.trends(schools="").status_code, 400)
+        self.assertEqual(self.trends(schools="1,x").status_code, 400)
+        self.assertEqual(self.trends(exam="ftna", schools="1").status_code, 400)
+
+
+class SearchTests(StoredResultsTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        schools = [
+            dict(school, name=name)
+            for school, name in zip(samples.make_schools(4), [
+                "AZANIA SECONDARY SCHOOL", "AZIMIO SECONDARY SCHOOL", "MZUMBE SECONDARY SCHOOL", "ST. MARY'S GIRLS",
+            ])
+        ]
+        cls.store(schools, 2022, rank=False)
+        cls.store([dict(schools[0], gpa=1.5)], 2023)
+
+    def search(self, query, **params):
+        return self.client.get("/api/search/", {"q": query, **params}).json()["results"]
+
+    def test_prefix_search(self):
+        self.assertEqual([school["name"] for school in self.search("az")], ["AZANIA SECONDARY SCHOOL", "AZIMIO SECONDARY SCHOOL"])
+        self.assertEqual([school["code"] for school in self.search("azania sec")], ["S0001"])
+        self.assertEqual([school["code"] for school in self.search("s0003")], ["S0003"])
+        self.assertEqual(len(self.search("secondary", limit=2)), 2)
+        self.assertEqual([school["code"] for school in self.search('mary\'s "')], ["S0004"])
+        self.assertEqual(self.search(" - "), [])
+
+    def test_latest_result(self):
+        azania, azimio = self.search("az")
+        self.assertEqual(azania["latest"], {"exam": "CSEE", "year": 2023, "gpa": 1.5, "rank": 1})
+        self.assertEqual((azimio["latest"]["year"], azimio["latest"]["rank"]), (2022, None))
+
+    def test_index_follows_school_changes(self):
+        school = School.objects.get(code="S0003")
+        school.name = "KIBAHA SECONDARY SCHOOL"
+        school.save()
+        School.objects.create(code="S0005", name="KIBO SECONDARY SCHOOL")
+        self.assertEqual([school["code"] for school in self.search("kib")], ["S0003", "S0005"])
+        self.assertEqual(self.search("mzumbe"), [])
+        School.objects.filter(code="S0005").delete()
+        self.assertEqual([school["code"] for school in self.search("kibo")], [])
+
+
+@override_settings(API_METRICS=True)
+class RequestMetricsTests(StoredResultsTestCase):
+
+    school_count = 10
+
+    def setUp(self):
+        super().setUp()
+        caching.stats.reset()
+        metrics.route_metrics.reset()
+
+    def test_server_timing(self):
+        response = self.client.get("/api/rankings/csee/2023/")
+        timings = dict(entry.split(";", 1) for entry in response["Server-Timing"].split(", "))
+        self.assertEqual(set(timings), {"total", "db", "serialize"})
+        self.assertIn('desc="3 queries"', timings["db"])
+
+        # Cache hits are not rendered again
+        response = self.client.get("/api/rankings/csee/2023/")
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+        self.assertNotIn("serialize", response["Server-Timing"])
+
+    def test_metrics_per_route(self):
+        for year in (2023, 2023, 2022):
+            self.client.get(f"/api/rankings/csee/{year}/")
+        self.client.get("/api/missing/")
+        data = self.client.get("/api/metrics/").json()
+        self.assertTrue(data["enabled"])
+        route = data["routes"]["api/rankings/<str:exam_type>/<int:year>/"]
+        self.assertEqual(route["requests"], 3)
+        # A cache hit, a miss, and a year without summaries that falls back to the aggregate
+        self.assertEqual(route["queries"], {"p50": 3, "p95": 4, "p99": 4})
+        self.assertGreater(route["bytes"]["p50"], 0)
+        self.assertGreater(route["total_ms"]["p95"], 0)
+        self.assertEqual(data["routes"]["unmatched"]["requests"], 1)
+        self.assertEqual(data["cache"]["rankings"], {"hits": 1, "misses": 2})
+
+    @override_settings(API_METRICS=False)
+    def test_disabled(self):
+        response = self.client.get("/api/rankings/csee/2023/")
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get("/api/metrics/").json()["routes"], {})
+
+    def test_samples_are_bounded(self):
+        route_metrics = metrics.RouteMetrics(size=2)
+        for total in (1, 2, 3):
+            route_metrics.record("route", total_ms=total, serialize_ms=None)
+        self.assertEqual(route_metrics.summary(), {
+            "route": {"requests": 3, "total_ms": {"p50": 2, "p95": 3, "p99": 3}, "serialize_ms": {"p50": 0, "p95": 0, "p99": 0}},
+        })
+
+
+class BenchmarkTests(SimpleTestCase):
+    """Runs benchmark suites with tiny sizes, each on its own scratch database."""
+
+    databases = {"default"}
+
+    def benchmark(self, suite, **options):
+        out = StringIO()
+        call_command("benchmark", suite=[suite], stdout=out, **options)
+        return out.getvalue()
+
+    def test_locking(self):
+        output = self.benchmark("locking", db_schools=20, readers=1)
+        self.assertIn("journal delete", output)
+        self.assertIn("journal wal", output)
+        for line in output.splitlines()[1:]:
+            reads = int(line.split(", ")[1].split()[0])
+            self.assertGreater(reads, 0, line)
+
+    # Tiny sizes, so every suite finishes in a few seconds
+    SIZES = {
+        "schools": 3, "repeat": 1, "db_schools": 30, "requests": 2, "readers": 1,
+        "years": "2023", "exams": ["csee"], "detail_schools": 5,
+    }
+
+    def report(self, suite, *names):
+        """
+        Run ``suite`` with a JSON report and check it has a non-zero
+        throughput and timings for each of ``names``.
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            self.benchmark(suite, report=path, **self.SIZES)
+            with open(path, encoding="utf-8") as f:
+                report = json.load(f)
+        self.assertEqual(set(report), {"created", "commit", "python", "django", "database", "options", "results"})
+        self.assertEqual(report["options"]["db_schools"], 30)
+        results = report["results"][suite]
+        for name in names:
+            self.assertIn(name, results)
+            for key, value in results[name].items():
+                if key.endswith(("_ms", "_op", "_row", "per_sec")) or key in ("queries", "bytes"):
+                    self.assertGreater(value, 0, f"{suite}/{name} {key}")
+        return report
+
+    def test_parse(self):
+        self.report("parse", "parse_* methods", "parse_school_page", "PageExtractor", "parse_school_result", "index_schools")
+
+    def test_region(self):
+        self.report("region", "parse_school_region", "detect_region", "detect_region, whole page")
+
+    def test_api(self):
+        self.report(
+            "api", "home", "results", "results, region", "rankings", "rankings, first page", "rankings summary",
+            "regions", "school detail", "school students", "subjects", "subject leaderboard", "search",
+            "trends, 500 schools", "export, csv", "scrape status",
+        )
+
+    def test_rankings(self):
+        self.report("rankings", "rankings", "rankings, columns", "rankings, cached", "rankings, first page", "rankings summary", "regions")
+
+    def test_trends(self):
+        self.report("trends", "trends, 500 schools", "trends, one region")
+
+    def test_serialize(self):
+        self.report(
+            "serialize", "ExamResultSerializer", "flat_exam_results", "flat_exam_results, columns",
+            "SchoolSerializer per ranking", "flat_rankings", "flat_rankings, columns",
+        )
+
+    def test_locking_report(self):
+        report = self.report("locking", "rollback journal (defaults)", "settings OPTIONS")
+        self.assertEqual(report["results"]["locking"]["settings OPTIONS"]["journal_mode"], "wal")
+
+    def test_compare(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            self.benchmark("region", report=path, **self.SIZES)
+            output = self.benchmark("region", compare=path, **self.SIZES)
+        self.assertIn(f"Compared with {path}", output)
+        self.assertRegex(output, r"region/detect_region: [\d.]+ -> [\d.]+ \([+-][\d.]+%\)")
+
+
+class PercentileTests(SimpleTestCase):
+
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(metrics.percentiles(values), {"p50": 50, "p95": 95, "p99": 99})
+        self.assertEqual(metrics.percentile([], 50), 0)
+        self.assertEqual(metrics.percentile([3.0], 99), 3.0)
+
+
+class ParseSchoolPageTests(SimpleTestCase):
+    """The single-pass parser must agree with the legacy BeautifulSoup parsers."""
+
+    def legacy(self, html, name=""):
+        soup = BeautifulSoup(html, "html.parser")
+        return {
+            "division_summary": legacy_parsing.parse_division_summary(soup),
+            "overall": legacy_parsing.parse_overall_performance(soup),
+            "division_performance": legacy_parsing.parse_division_performance(soup),
+            "subjects": legacy_parsing.parse_subjects_performance(soup),
+            "students": legacy_parsing.parse_student_results(soup),
+            "region": legacy_parsing.parse_school_region(soup, name),
+        }
+
+    def test_matches_legacy_parsers(self):
+        for school in samples.make_schools(5):
+            html = samples.render_school_page(school, "csee", 2023, students=10)
+            self.assertEqual(parse_school_page(html, school["name"]), self.legacy(html, school["name"]))
+
+    def test_nested_tables_and_text_fallback(self):
+        html = """
+        <html><body><p>KIGOMA</p>
+        <table><tr><td>
+          <table><tr><td>EXAMINATION CENTRE GPA</td><td> 2.5 <b>(B)</b></td></tr></table>
+        </td></tr></table>
+        <table><caption>DIVISION PERFORMANCE SUMMARY</caption>
+          <tr><th>SEX</th><th>I</th></tr>
+        </table>
+        <pre>T  1 2 3 4 5</pre>
+        <script>var region = "Arusha";</script>
+        </body></html>
+        """
+        page = parse_school_page(html)
+        self.assertEqual(page, self.legacy(html))
+        self.assertEqual(page["overall"]["EXAMINATION CENTRE GPA"], "2.5(B)")
+        self.assertEqual(page["division_summary"], {"I": 1, "II": 2, "III": 3, "IV": 4, "0": 5})
+        self.assertEqual(page["region"], "Kigoma")
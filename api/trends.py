@@ -0,0 +1,91 @@
+# trends.py
+"""
+Year-over-year trends of many schools at once.
+
+All results of the requested schools come back from one ordered query and
+are folded, in a single pass, into per-school series aligned on a shared
+list of years (``None`` where a school has no result that year), so
+comparing hundreds of schools costs the same one query as comparing two.
+"""
+from .models import ExamResult
+
+DIVISIONS = ["division1", "division2", "division3", "division4", "division0"]
+
+TREND_COLUMNS = [
+    "school_id", "school__code", "school__name", "school__region", "year", "gpa", "total",
+    *DIVISIONS,
+    "ranking__national_rank", "ranking__region_rank", "ranking__rank_change",
+]
+
+# Most schools that can be listed by id in one request
+MAX_SCHOOLS = 1000
+
+
+def trend_rows(exam, school_ids=None, region=None, first_year=None, last_year=None):
+    """
+    Result rows of the selected schools as tuples in ``TREND_COLUMNS`` order,
+    by school and year.
+    """
+    results = ExamResult.objects.filter(exam=exam.upper())
+    if school_ids is not None:
+        results = results.filter(school_id__in=school_ids)
+    if region:
+        results = results.filter(school__region_key=region.lower())
+    if first_year:
+        results = results.filter(year__gte=first_year)
+    if last_year:
+        results = results.filter(year__lte=last_year)
+    return results.order_by("school_id", "year").values_list(*TREND_COLUMNS)
+
+
+def changes(series, digits):
+    """
+    Difference of each value from the year before, None where either is missing.
+    """
+    return [None] + [
+        round(value - previous, digits) if value is not None and previous is not None else None
+        for previous, value in zip(series, series[1:])
+    ]
+
+
+def school_trends(rows):
+    """
+    Fold result rows (see ``trend_rows``) into ``{"years": [...], "schools": [...]}``.
+    Every series of a school has one entry per year in ``years``. GPAs of 0
+    (no valid GPA) are reported as None; division shares are percentages of
+    the school's candidates.
+    """
+    rows = list(rows)
+    years = sorted({row[4] for row in rows})
+    position = {year: index for index, year in enumerate(years)}
+    empty = [None] * len(years)
+
+    schools = []
+    school = None
+    for (school_id, code, name, region, year, gpa, total, *divisions,
+         national_rank, region_rank, rank_change) in rows:
+        if school is None or school["id"] != school_id:
+            school = {
+                "id": school_id, "code": code, "name": name, "region": region,
+                "gpa": empty[:], "total": empty[:],
+                "national_rank": empty[:], "region_rank": empty[:], "rank_change": empty[:],
+                "division_share": {division: empty[:] for division in DIVISIONS},
+            }
+            schools.append(school)
+        index = position[year]
+        school["gpa"][index] = gpa if gpa > 0 else None
+        school["total"][index] = total
+        school["national_rank"][index] = national_rank
+        school["region_rank"][index] = region_rank
+        school["rank_change"][index] = rank_change
+        if total:
+            for division, count in zip(DIVISIONS, divisions):
+                school["division_share"][division][index] = round(100 * count / total, 2)
+
+    for school in schools:
+        # Lower GPAs are better, so a negative change is an improvement
+        school["gpa_change"] = changes(school["gpa"], 4)
+        school["division_share_change"] = {
+            division: changes(shares, 2) for division, shares in school["division_share"].items()
+        }
+    return {"years": years, "schools": schools}
@@ -1,8 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from api.views import (
-    SchoolViewSet, ExamResultViewSet, rankings, 
-    home_data, school_detail, trigger_scrape, scrape_status
+    SchoolViewSet, ExamResultViewSet, rankings, rankings_summary,
+    home_data, school_detail, trigger_scrape, scrape_status,
+    subjects_performance, subject_leaderboard, school_students, export_results, search_schools,
+    school_trends, region_summaries, request_metrics,
 )
 
 router = DefaultRouter()
@@ -13,7 +15,16 @@ urlpatterns = [
     path('api/', include(router.urls)),
     path('api/home/', home_data, name='api_home'),
     path('api/rankings/<str:exam_type>/<int:year>/', rankings, name='api_rankings'),
+    path('api/rankings/<str:exam_type>/<int:year>/summary/', rankings_summary, name='api_rankings_summary'),
+    path('api/regions/<str:exam_type>/<int:year>/', region_summaries, name='api_region_summaries'),
     path('api/school/<int:school_id>/', school_detail, name='api_school_detail'),
+    path('api/school/<int:school_id>/students/', school_students, name='api_school_students'),
+    path('api/subjects/<str:exam_type>/<int:year>/', subjects_performance, name='api_subjects'),
+    path('api/subjects/<str:exam_type>/<int:year>/<str:subject_code>/', subject_leaderboard, name='api_subject_leaderboard'),
+    path('api/trends/', school_trends, name='api_trends'),
+    path('api/search/', search_schools, name='api_search'),
+    path('api/export/', export_results, name='api_export'),
     path('api/scrape/', trigger_scrape, name='api_scrape'),
     path('api/scrape/status/', scrape_status, name='api_scrape_status'),
+    path('api/metrics/', request_metrics, name='api_metrics'),
 ]
\ No newline at end of file
@@ -1,10 +1,23 @@
 from rest_framework import viewsets, generics
 from rest_framework.decorators import api_view
+from rest_framework.pagination import CursorPagination
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Sum, Avg, Count, Q
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from .models import School, ExamResult
-from .serializers import SchoolSerializer, ExamResultSerializer
+from django.views.decorators.http import require_GET
+from . import jobs, search, trends
+from .caching import cached_response, conditional_response, stats as cache_stats
+from .exports import FORMATS, export_filename, export_lines, export_rows
+from .metrics import route_metrics
+from .models import School, ExamResult, Ranking, ResultSummary, ScrapeJob, StudentResult, SubjectPerformance
+from .parsing import REGION_NAMES
+from .serializers import (
+    SchoolSerializer, ExamResultSerializer, ScrapeJobSerializer, StudentResultSerializer, SubjectPerformanceSerializer,
+    flat_exam_results, flat_rankings,
+)
+from .services import GPA_BINS, ranking_statistics
 
 class SchoolViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = School.objects.all()
@@ -25,69 +38,116 @@ class ExamResultViewSet(viewsets.ReadOnlyModelViewSet):
         if year:
             queryset = queryset.filter(year=year)
         if region:
-            queryset = queryset.filter(school__region__iexact=region)
+            queryset = queryset.filter(school__region_key=region.lower())
             
         return queryset.order_by("gpa", "-total")
 
+    def list(self, request, *args, **kwargs):
+        # Lists are built from values() rows rather than model instances
+        rows = flat_exam_results.values(self.filter_queryset(self.get_queryset()))
+        layout = request.query_params.get('layout')
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(flat_exam_results.data(page, layout))
+        return Response(flat_exam_results.data(rows, layout))
+
+class RankingCursorPagination(CursorPagination):
+    """
+    Keyset pagination over the materialized rankings. The snapshot ranks
+    encode the (gpa, -total, id) order, so a page is an index range scan
+    from the cursor's rank whatever the page number.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('region'):
+            return ('region_rank',)
+        return ('national_rank',)
+
+
+def _region_param(request):
+    region = request.query_params.get('region', '').strip()
+    return REGION_NAMES.get(region.lower(), region)
+
+
+@conditional_response
+@cached_response('rankings')
 @api_view(['GET'])
 def rankings(request, exam_type, year):
-    results = ExamResult.objects.filter(
-        exam=exam_type.upper(), 
-        year=year,
-        gpa__gt=0
-    ).select_related('school').order_by("gpa", "-total")
-    
-    # Calculate statistics
-    total_schools = results.count()
-    total_students = results.aggregate(total=Sum('total'))['total'] or 0
-    
-    valid_results = results.exclude(gpa=0)
-    avg_gpa_all = valid_results.aggregate(avg=Avg('gpa'))['avg'] or 0 if valid_results.exists() else 0
-    
-    best_gpa = results.first().gpa if results else 0
-    
-    division_totals = results.aggregate(
-        div1=Sum('division1'),
-        div2=Sum('division2'),
-        div3=Sum('division3'),
-        div4=Sum('division4'),
-        div0=Sum('division0')
-    )
-    
-    gpa_ranges = {
-        '1_2': results.filter(gpa__gte=1.0, gpa__lt=2.0).count(),
-        '2_3': results.filter(gpa__gte=2.0, gpa__lt=3.0).count(),
-        '3_4': results.filter(gpa__gte=3.0, gpa__lt=4.0).count(),
-        '4_plus': results.filter(gpa__gte=4.0).count(),
-    }
-    
-    # Add ranking position to each result
-    ranked_results = []
-    for rank, result in enumerate(results, start=1):
-        ranked_results.append({
-            'rank': rank,
-            'school': SchoolSerializer(result.school).data,
-            'gpa': result.gpa,
-            'division1': result.division1,
-            'division2': result.division2,
-            'division3': result.division3,
-            'division4': result.division4,
-            'division0': result.division0,
-            'total': result.total,
-        })
-    
+    region = _region_param(request)
+
+    layout = request.query_params.get('layout')
+
+    # Ranked list, read in order from the materialized rankings
+    ranked = flat_rankings.values(Ranking.objects.filter(exam=exam_type.upper(), year=year))
+    if region:
+        ranked = ranked.filter(region=region)
+
+    # Paging is opt-in, so existing clients still get the whole year
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        page_size = request.query_params.get('page_size')
+        if page_size is not None and not (page_size.isdigit() and int(page_size) >= 1):
+            return Response({'error': 'page_size must be a positive integer'}, status=400)
+        paginator = RankingCursorPagination()
+        page = paginator.paginate_queryset(ranked, request)
+        response = paginator.get_paginated_response(flat_rankings.data(page, layout))
+        response.data.update({'exam_type': exam_type, 'year': year, 'region': region or None})
+        return response
+
+    ranked = ranked.order_by('region_rank' if region else 'national_rank')
     return Response({
-        'results': ranked_results,
+        'results': flat_rankings.data(ranked, layout),
         'exam_type': exam_type,
         'year': year,
-        'total_schools': total_schools,
-        'total_students': total_students,
-        'avg_gpa_all': round(avg_gpa_all, 2),
-        'best_gpa': round(best_gpa, 4) if best_gpa else 0,
-        'division_totals': division_totals,
-        'gpa_ranges': gpa_ranges,
+        **ranking_statistics(exam_type, year, region),
+    })
+
+
+@conditional_response
+@cached_response('rankings_summary')
+@api_view(['GET'])
+def rankings_summary(request, exam_type, year):
+    region = _region_param(request)
+    return Response({
+        'exam_type': exam_type,
+        'year': year,
+        'region': region or None,
+        **ranking_statistics(exam_type, year, region),
+    })
+
+
+SUMMARY_FIELDS = (
+    'region', 'schools', 'candidates', 'division1', 'division2', 'division3', 'division4', 'division0',
+    'mean_gpa', 'weighted_gpa', 'median_gpa', 'best_gpa', 'gpa_histogram',
+)
+
+
+@conditional_response
+@cached_response('region_summaries')
+@api_view(['GET'])
+def region_summaries(request, exam_type, year):
+    """
+    National and per-region totals of one exam/year, read from the
+    precomputed result summaries
+    """
+    national, regions = None, []
+    for summary in ResultSummary.objects.filter(exam=exam_type.upper(), year=year).values(*SUMMARY_FIELDS):
+        if summary['region']:
+            regions.append(summary)
+        else:
+            national = {key: value for key, value in summary.items() if key != 'region'}
+    return Response({
+        'exam_type': exam_type,
+        'year': year,
+        'gpa_bins': GPA_BINS,
+        'national': national,
+        'regions': regions,
     })
 
+@conditional_response
+@cached_response('home_data')
 @api_view(['GET'])
 def home_data(request):
     years = list(ExamResult.objects.values_list('year', flat=True).distinct().order_by('-year'))
@@ -109,58 +169,242 @@ def home_data(request):
         'total_schools': total_schools,
     })
 
+@conditional_response
+@cached_response('school_detail')
 @api_view(['GET'])
 def school_detail(request, school_id):
     school = get_object_or_404(School, id=school_id)
     results = ExamResult.objects.filter(school=school).order_by('-year', 'exam')
+    rankings = Ranking.objects.filter(school=school).order_by('-year', 'exam').values(
+        'exam', 'year', 'national_rank', 'region_rank', 'percentile', 'rank_change'
+    )
     
     return Response({
         'school': SchoolSerializer(school).data,
         'results': ExamResultSerializer(results, many=True).data,
+        'rankings': list(rankings),
     })
 
+def _int_param(request, name, default, minimum=None, maximum=None):
+    try:
+        value = int(request.query_params.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    if value is None:
+        return value
+    if minimum is not None:
+        value = max(value, minimum)
+    return min(value, maximum) if maximum is not None else value
 
+@api_view(['GET'])
+def subjects_performance(request, exam_type, year):
+    """
+    National summary per subject: centres offering it, candidates who sat it
+    and the average centre GPA
+    """
+    subjects = SubjectPerformance.objects.filter(
+        exam=exam_type.upper(),
+        year=year,
+    ).values('code', 'name').annotate(
+        centres=Count('id'),
+        candidates=Sum('sat'),
+        passed=Sum('passed'),
+        avg_gpa=Avg('gpa', filter=Q(gpa__gt=0)),
+    ).order_by('code')
+
+    return Response({
+        'exam_type': exam_type,
+        'year': year,
+        'subjects': [
+            dict(subject, avg_gpa=round(subject['avg_gpa'] or 0, 4))
+            for subject in subjects
+        ],
+    })
+
+@api_view(['GET'])
+def subject_leaderboard(request, exam_type, year, subject_code):
+    """
+    Centres ranked by GPA in one subject (lower is better). ``min_sat`` skips
+    centres with fewer candidates, ``limit`` caps the list (default 50, max 500)
+    """
+    min_sat = _int_param(request, 'min_sat', 1, minimum=0)
+    limit = _int_param(request, 'limit', 50, minimum=1, maximum=500)
+
+    rows = SubjectPerformance.objects.filter(
+        exam=exam_type.upper(),
+        year=year,
+        code=subject_code,
+        gpa__gt=0,
+        sat__gte=min_sat,
+    ).select_related('result__school').order_by('gpa', '-sat')[:limit]
+
+    results = []
+    for rank, row in enumerate(rows, start=1):
+        results.append(dict(
+            SubjectPerformanceSerializer(row).data,
+            rank=rank,
+            school=SchoolSerializer(row.result.school).data,
+        ))
+
+    return Response({
+        'exam_type': exam_type,
+        'year': year,
+        'subject': subject_code,
+        'results': results,
+    })
+
+@api_view(['GET'])
+def school_students(request, school_id):
+    """
+    Candidates of a school for one exam and year (``exam_type`` and ``year``
+    query parameters, default: the school's latest result)
+    """
+    school = get_object_or_404(School, id=school_id)
+    results = ExamResult.objects.filter(school=school).order_by('-year', 'exam')
+    exam_type = request.query_params.get('exam_type')
+    year = request.query_params.get('year')
+    if exam_type:
+        results = results.filter(exam=exam_type.upper())
+    if year:
+        results = results.filter(year=_int_param(request, 'year', 0))
+    result = results.first()
+    if result is None:
+        return Response({'error': 'No results for this school'}, status=404)
+
+    students = StudentResult.objects.filter(result=result).order_by('cno')
+    return Response({
+        'school': SchoolSerializer(school).data,
+        'exam_type': result.exam,
+        'year': result.year,
+        'subjects': SubjectPerformanceSerializer(result.subjects.order_by('code'), many=True).data,
+        'students': StudentResultSerializer(students, many=True).data,
+    })
+
+
+@conditional_response
+@cached_response('search_schools')
+@api_view(['GET'])
+def search_schools(request):
+    """
+    Schools whose code or name starts with the words in ``q``, best match
+    first, with their latest result; ``limit`` defaults to 10 (at most 50)
+    """
+    query = request.query_params.get('q', '')
+    limit = _int_param(request, 'limit', 10, minimum=1, maximum=50)
+    return Response({
+        'query': query,
+        'results': search.search_schools(query, limit),
+    })
+
+@conditional_response
+@cached_response('school_trends')
+@api_view(['GET'])
+def school_trends(request):
+    """
+    GPA, rank and division-share series across years of the schools listed
+    in ``schools`` (comma-separated ids) or of every school in ``region``,
+    for one ``exam``, optionally limited to ``from``..``to`` years
+    """
+    exam = request.query_params.get('exam', '').upper()
+    if exam not in ('CSEE', 'ACSEE'):
+        return Response({'error': 'exam must be CSEE or ACSEE'}, status=400)
+    region = _region_param(request)
+    school_ids = None
+    if 'schools' in request.query_params:
+        try:
+            # An empty list means no filter, as if schools was left out
+            school_ids = {int(value) for value in request.query_params['schools'].split(',') if value.strip()} or None
+        except ValueError:
+            return Response({'error': 'schools must be comma-separated ids'}, status=400)
+        if school_ids and len(school_ids) > trends.MAX_SCHOOLS:
+            return Response({'error': f'at most {trends.MAX_SCHOOLS} schools per request'}, status=400)
+    if not school_ids and not region:
+        return Response({'error': 'schools or region is required'}, status=400)
+
+    rows = trends.trend_rows(
+        exam, school_ids, region,
+        first_year=_int_param(request, 'from', None), last_year=_int_param(request, 'to', None),
+    )
+    return Response({'exam': exam, 'region': region or None, **trends.school_trends(rows)})
+
+
+@require_GET
+@conditional_response
+def export_results(request):
+    """
+    Stream results as CSV or NDJSON (``format`` query parameter), optionally
+    filtered by ``exam_type``, ``year`` and ``region``
+    """
+    export_format = request.GET.get('format', 'csv')
+    if export_format not in FORMATS:
+        return HttpResponseBadRequest(f"format must be one of: {', '.join(FORMATS)}")
+    exam_type = request.GET.get('exam_type')
+    year = request.GET.get('year')
+    region = request.GET.get('region')
+    if year and not year.isdigit():
+        return HttpResponseBadRequest("year must be a number")
+
+    rows = export_rows(exam_type, year and int(year), region)
+    response = StreamingHttpResponse(export_lines(rows, export_format), content_type=FORMATS[export_format])
+    filename = export_filename(export_format, exam_type, year, region)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
 
-from rest_framework.decorators import api_view
-from rest_framework.response import Response
-from django.core.management import call_command
-from django.core.cache import cache
-import threading
 
 @api_view(['POST'])
 def trigger_scrape(request):
     """
-    Trigger the scraping process via API
+    Queue a scrape for ``exam_type`` and ``year``; it is run by the
+    scrape_worker command
     """
     exam_type = request.data.get('exam_type')
     year = request.data.get('year')
     
     if not exam_type or not year:
         return Response({'error': 'exam_type and year are required'}, status=400)
+    if str(exam_type).upper() not in ('CSEE', 'ACSEE'):
+        return Response({'error': 'exam_type must be CSEE or ACSEE'}, status=400)
+    # Also rejects JSON floats and booleans, which int() would accept
+    if not str(year).isdigit():
+        return Response({'error': 'year must be a number'}, status=400)
+    year = int(year)
     
-    # Check if scraping is already in progress
-    if cache.get('scraping_in_progress'):
-        return Response({'status': 'scraping_already_in_progress'})
-    
-    # Run scraping in a separate thread to avoid blocking
-    def run_scrape():
-        cache.set('scraping_in_progress', True, timeout=3600)  # 1 hour timeout
-        try:
-            call_command('scrape_necta', exam=exam_type, year=year)
-        finally:
-            cache.delete('scraping_in_progress')
-    
-    thread = threading.Thread(target=run_scrape)
-    thread.daemon = True
-    thread.start()
-    
-    return Response({'status': 'scraping_started'})
+    # A scrape of the same exam/year that is queued or running is reused
+    job, created = jobs.enqueue(str(exam_type), year)
+    return Response({
+        'status': 'scraping_started' if created else 'scraping_already_in_progress',
+        'job': ScrapeJobSerializer(job).data,
+    }, status=202 if created else 200)
 
 @api_view(['GET'])
 def scrape_status(request):
     """
-    Check if scraping is in progress
+    Progress of queued and running scrapes and the most recent finished ones,
+    or of a single job with ``?job=<id>``
     """
+    job_id = request.query_params.get('job')
+    if job_id:
+        job = get_object_or_404(ScrapeJob, id=_int_param(request, 'job', 0))
+        return Response({'job': ScrapeJobSerializer(job).data})
+
+    active = list(ScrapeJob.objects.filter(status__in=ScrapeJob.ACTIVE).order_by('created_at'))
+    recent = ScrapeJob.objects.exclude(status__in=ScrapeJob.ACTIVE)[:10]
     return Response({
-        'scraping_in_progress': bool(cache.get('scraping_in_progress'))
-    })
\ No newline at end of file
+        'scraping_in_progress': any(job.status == ScrapeJob.RUNNING for job in active),
+        'jobs': ScrapeJobSerializer(active, many=True).data,
+        'recent': ScrapeJobSerializer(recent, many=True).data,
+    })
+
+
+@api_view(['GET'])
+def request_metrics(request):
+    """
+    Latency, SQL and response size percentiles per route measured by the
+    timing middleware in this process (only with ``API_METRICS`` on), and
+    the response cache hit counts
+    """
+    return Response({
+        'enabled': settings.API_METRICS,
+        'routes': route_metrics.summary(),
+        'cache': cache_stats.summary(),
+    })
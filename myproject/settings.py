@@ -43,6 +43,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.TimingMiddleware',  # Only active with API_METRICS
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -91,14 +92,58 @@ WSGI_APPLICATION = 'myproject.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Pragmas run on every new SQLite connection. WAL lets API readers carry on
+# while a scrape writes; the rest trade a little durability on power loss
+# (synchronous=NORMAL is still safe in WAL mode) for fewer fsyncs and a
+# bigger page cache. journal_mode is stored in the database file itself, so
+# the first connection switches db.sqlite3 to WAL for good and SQLite keeps
+# db.sqlite3-wal and -shm files next to it.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -64000,  # KiB, i.e. 64 MB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock when a transaction starts instead of on its
+            # first write, so writers queue on the busy timeout rather than
+            # failing with "database is locked" on lock upgrade.
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,  # Seconds to wait for a lock (busy_timeout)
+        },
     }
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Rendered API responses (see api.caching). Use FileBasedCache or Redis
+    # here to share them between worker processes.
+    'api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'api-responses',
+    },
+}
+
+API_CACHE_ALIAS = 'api'
+API_CACHE_TIMEOUT = 60 * 60 * 24  # Entries are invalidated by each scrape anyway
+
+# Per-request timings in Server-Timing headers and api/metrics/ (see api.middleware)
+API_METRICS = False
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 